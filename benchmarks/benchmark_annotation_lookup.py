@@ -0,0 +1,92 @@
+"""
+Benchmark of the annotation lookup of the postprocessing.
+
+Generates a synthetic COCO annotation file and compares looking up the annotations of every image
+with the index (`build_annotation_index` + `get_inference_data`) against the old linear scan.
+The linear scan is too slow to run for every image of a large file, so it is timed on a sample
+and extrapolated to the full file.
+
+Run from the root of the project:
+    python -m benchmarks.benchmark_annotation_lookup --images 100000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'postprocessing', 'app'))
+from scripts.utils.annotation_index import build_annotation_index, get_inference_data
+
+def generate_coco(num_images, annotations_per_image=2, seed=0):
+    rng = random.Random(seed)
+    images = []
+    annotations = []
+    for image_id in range(1, num_images + 1):
+        images.append({'id': image_id, 'width': 1920, 'height': 1080, 'file_name': f'cam{image_id % 20}/leging{image_id % 3}/IMG_{image_id:06d}.JPG'})
+        for _ in range(rng.randint(0, annotations_per_image * 2)):
+            annotations.append({
+                'id': len(annotations) + 1,
+                'image_id': image_id,
+                'category_id': rng.randint(0, 57),
+                'bbox': [rng.uniform(0, 1800), rng.uniform(0, 900), rng.uniform(10, 200), rng.uniform(10, 200)],
+                'score': rng.random()
+            })
+    return {'images': images, 'annotations': annotations, 'categories': []}
+
+def linear_lookup(filename, complete_annotation_json):
+    '''
+    The original lookup, that scans the images and all annotations for every file
+    '''
+    scores, boxes, labels = [], [], []
+    image_id = None
+    for item in complete_annotation_json['images']:
+        if item['file_name'] == filename:
+            image_id = item['id']
+            break
+    if image_id == None:
+        raise IndexError(f"An image id should have been found for '{filename}', but got None")
+
+    for annotation in [annotation for annotation in complete_annotation_json['annotations'] if annotation['image_id'] == image_id]:
+        scores.append(annotation['score'])
+        boxes.append(annotation['bbox'])
+        labels.append(annotation['category_id'])
+    return scores, boxes, labels
+
+def run_benchmark(num_images, sample_size):
+    coco = generate_coco(num_images)
+    filenames = [image['file_name'] for image in coco['images']]
+    print(f"Synthetic file: {len(coco['images'])} images, {len(coco['annotations'])} annotations")
+
+    start = time.perf_counter()
+    annotation_index = build_annotation_index(coco)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed_results = [get_inference_data(filename, annotation_index) for filename in filenames]
+    indexed_time = time.perf_counter() - start
+
+    sample = random.Random(1).sample(filenames, min(sample_size, len(filenames)))
+    start = time.perf_counter()
+    linear_results = [linear_lookup(filename, coco) for filename in sample]
+    linear_time = (time.perf_counter() - start) / len(sample) * len(filenames)
+
+    sample_positions = {filename: position for position, filename in enumerate(filenames)}
+    for filename, linear_result in zip(sample, linear_results):
+        assert indexed_results[sample_positions[filename]] == linear_result, f"Results differ for '{filename}'"
+
+    print(f"Index build:           {build_time:10.3f} s")
+    print(f"Indexed lookups (all): {indexed_time:10.3f} s")
+    print(f"Linear lookups (est.): {linear_time:10.3f} s (measured on {len(sample)} images)")
+    print(f"Speedup:               {linear_time / (build_time + indexed_time):10.1f}x")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=100000, help='Amount of images in the synthetic COCO file')
+    parser.add_argument('--sample', type=int, default=50, help='Amount of images the linear scan is measured on')
+    args = parser.parse_args()
+
+    for num_images in sorted({args.images // 100, args.images // 10, args.images}):
+        run_benchmark(num_images, args.sample)
+        print()
@@ -0,0 +1,76 @@
+"""
+Benchmark of loading the detections of a run in the postprocessing.
+
+Writes the same synthetic detections as a COCO annotation file (with `indent=4`, like the model runners do)
+and as a detection store, and compares the time and size of both. Loading is timed up to an index
+that `get_inference_data` can use, and both indexes must give the same detections for every image.
+
+Run from the root of the project:
+    python -m benchmarks.benchmark_detection_store --images 100000
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'postprocessing', 'app'))
+from scripts.utils.annotation_index import build_annotation_index, build_detection_index, get_inference_data
+from scripts.utils.detection_store import DetectionStoreWriter, read_detections
+from benchmarks.benchmark_annotation_lookup import generate_coco
+
+def write_detection_store(coco, filepath):
+    annotations_by_image = {}
+    for annotation in coco['annotations']:
+        annotations_by_image.setdefault(annotation['image_id'], []).append(annotation)
+
+    with DetectionStoreWriter(filepath) as detection_store:
+        for image in coco['images']:
+            detections = [(annotation['category_id'], str(annotation['category_id']), annotation['bbox'], annotation['score'])
+                          for annotation in annotations_by_image.get(image['id'], [])]
+            detection_store.add_image(image['file_name'], image['width'], image['height'], detections)
+
+def run_benchmark(num_images, folder):
+    coco = generate_coco(num_images)
+    coco_path = os.path.join(folder, 'annotations.json')
+    store_path = os.path.join(folder, 'detections.arrow')
+
+    start = time.perf_counter()
+    with open(coco_path, 'w') as file:
+        json.dump(coco, file, indent=4)
+    coco_write_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    write_detection_store(coco, store_path)
+    store_write_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with open(coco_path, 'r') as file:
+        coco_index = build_annotation_index(json.load(file))
+    coco_read_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    store_index = build_detection_index(read_detections(store_path, columns=['path', 'image_id', 'category_id', 'score', 'bbox_x', 'bbox_y', 'bbox_width', 'bbox_height']))
+    store_read_time = time.perf_counter() - start
+
+    for image in coco['images']:
+        assert get_inference_data(image['file_name'], coco_index) == get_inference_data(image['file_name'], store_index), f"Detections differ for '{image['file_name']}'"
+
+    print(f"{len(coco['images'])} images, {len(coco['annotations'])} detections")
+    print(f"{'':8} {'write (s)':>10} {'load (s)':>10} {'size (MB)':>10}")
+    print(f"{'COCO':8} {coco_write_time:>10.2f} {coco_read_time:>10.2f} {os.path.getsize(coco_path) / 1e6:>10.1f}")
+    print(f"{'store':8} {store_write_time:>10.2f} {store_read_time:>10.2f} {os.path.getsize(store_path) / 1e6:>10.1f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=100000, help='Amount of images in the synthetic run')
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    try:
+        run_benchmark(args.images, folder)
+    finally:
+        shutil.rmtree(folder)
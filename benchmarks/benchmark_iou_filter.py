@@ -0,0 +1,103 @@
+"""
+Benchmark of the IoU box filter of the YOLO runner.
+
+Compares the vectorized `filter_boxes_by_iou` with the original pure Python `filter_boxes_by_iou_loop`.
+Before timing, both are run on the same random predictions and their output must be identical.
+
+Run from the root of the project:
+    python -m benchmarks.benchmark_iou_filter
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'models', 'yolo', 'app'))
+from scripts.utils.iou_utils import filter_boxes_by_iou, filter_boxes_by_iou_batched, filter_boxes_by_iou_loop
+
+IMAGE_WIDTH = 1920
+IMAGE_HEIGHT = 960
+BOX_COUNTS = (5, 20, 50, 100, 300)
+
+def generate_predictions(rng, num_boxes):
+    '''
+    Generate random predictions, with clusters of overlapping boxes like a real detector gives
+
+    Parameters
+    ----------
+        rng: np.random.Generator
+            The random generator to use
+        num_boxes: int
+            The amount of boxes
+
+    Returns
+    -------
+        labels: list
+        boxes: list
+            Boxes in the [x_min, y_min, x_max, y_max] format
+        scores: list
+    '''
+    num_clusters = max(1, num_boxes // 5)
+    centers = rng.uniform([0, 0], [IMAGE_WIDTH, IMAGE_HEIGHT], size=(num_clusters, 2))
+    cluster_ids = rng.integers(0, num_clusters, size=num_boxes)
+
+    box_centers = centers[cluster_ids] + rng.normal(0, 20, size=(num_boxes, 2))
+    box_sizes = rng.uniform(20, 250, size=(num_boxes, 2))
+
+    boxes = np.concatenate([box_centers - box_sizes / 2, box_centers + box_sizes / 2], axis=1).astype(np.float32)
+    scores = rng.uniform(0.3, 1, size=num_boxes).astype(np.float32)
+    labels = rng.integers(0, 58, size=num_boxes)
+
+    return list(labels), list(boxes), list(scores)
+
+def check_equivalence(rng, runs=500):
+    for run in range(runs):
+        labels, boxes, scores = generate_predictions(rng, int(rng.integers(0, 60)))
+        # Ties in the scores and exactly covering boxes are the edge cases of the suppression rules
+        if run % 3 == 0 and len(scores) > 1:
+            scores[1] = scores[0]
+            boxes[1] = boxes[0].copy()
+
+        expected = filter_boxes_by_iou_loop(labels, boxes, scores, iou_threshold=0.3)
+        actual = filter_boxes_by_iou(labels, boxes, scores, iou_threshold=0.3)
+
+        assert expected[0] == actual[0], f"Labels differ on run {run}"
+        assert all(np.array_equal(e, a) for e, a in zip(expected[1], actual[1])) and len(expected[1]) == len(actual[1]), f"Boxes differ on run {run}"
+        assert expected[2] == actual[2], f"Scores differ on run {run}"
+
+    print(f"Equivalence check passed on {runs} random images")
+
+def time_function(func, predictions, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for labels, boxes, scores in predictions:
+            func(labels, boxes, scores, iou_threshold=0.3)
+    return (time.perf_counter() - start) / repeat
+
+def run_benchmark(rng, images, repeat):
+    print(f"{'boxes/image':>12} {'loop (ms)':>12} {'vectorized (ms)':>16} {'speedup':>8}")
+    for num_boxes in BOX_COUNTS:
+        predictions = [generate_predictions(rng, num_boxes) for _ in range(images)]
+
+        loop_time = time_function(filter_boxes_by_iou_loop, predictions, repeat)
+        vectorized_time = time_function(filter_boxes_by_iou, predictions, repeat)
+
+        print(f"{num_boxes:>12} {loop_time * 1000:>12.2f} {vectorized_time * 1000:>16.2f} {loop_time / vectorized_time:>7.1f}x")
+
+    predictions = [generate_predictions(rng, 50) for _ in range(images)]
+    start = time.perf_counter()
+    filter_boxes_by_iou_batched(*zip(*predictions), iou_threshold=0.3)
+    print(f"Batched: {images} images with 50 boxes in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=100, help='Amount of images per box count')
+    parser.add_argument('--repeat', type=int, default=3, help='Amount of times each measurement is repeated')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    check_equivalence(rng)
+    run_benchmark(rng, args.images, args.repeat)
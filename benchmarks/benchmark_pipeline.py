@@ -0,0 +1,369 @@
+"""
+End-to-end benchmark of the pipeline, on a synthetic camera trap dataset.
+
+Generates an image tree like the real data (`<camera>/<leging>/<image>.JPG`), with bursts of frames a few
+seconds apart and a 120 px metadata strip at the bottom of every image, with the camera, date and time
+rendered as text. Then every stage of the pipeline is timed on it:
+- `inference/<model>`: The model runners, on the CPU, in a subprocess (like in their container).
+  Their `metrics.json` (time per image per stage) is added to the report.
+- `ocr`: The metadata extraction of the postprocessing, on the first `--ocr-images` images.
+- `join/<source>`, `remove_duplicates/<source>`, `get_statistics/<source>`: The postprocessing of the detections.
+- `get_labeled_images/<source>`: Loading the detections in the GUI.
+
+The postprocessing and GUI stages use the detections of every model that ran. When no model could run
+(the weights are not in the repository), they use synthetic detections (`synthetic`).
+A stage that can't run (missing weights, tesseract or dependencies) is reported as `skipped`, with the reason.
+
+The report is a JSON file with the version (git commit), the machine, the parameters and per stage its
+status, seconds (the median of `--repeat` runs), images and images per second. Compare it to the report
+of another version with `--baseline`: every stage that got more than `--threshold` slower is a regression.
+
+Run from the root of the project:
+    python -m benchmarks.benchmark_pipeline --cameras 4 --legings 2 --images 100
+    python -m benchmarks.benchmark_pipeline --baseline benchmarks/reports/<previous report>.json
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from PIL import Image, ImageDraw, ImageFont
+
+ROOT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT_PATH, 'postprocessing', 'app'))
+from scripts.config.constants import IMAGE_METADATA_HEIGHT
+from scripts.utils.detection_store import DetectionStoreWriter
+
+REPORTS_PATH = os.path.join(ROOT_PATH, 'benchmarks', 'reports')
+MODELS = ['yolo', 'efficient_det']
+# The weights are not part of the repository, a model without them is skipped
+MODEL_WEIGHTS = {'yolo': 'model.pt', 'efficient_det': 'efficientdet-d2_188_63500.pth'}
+SYNTHETIC_SOURCE = 'synthetic'
+LABELS = [(1, 'duck'), (2, 'goose'), (5, 'hare'), (11, 'swan'), (12, 'crow'), (27, 'fox'), (47, 'heron'), (10, 'coot')]
+METADATA_FONT_SIZE = 48 # Smaller for images below 1920 px wide, so the text fits on the strip
+
+def load_metadata_font(width):
+    try:
+        return ImageFont.load_default(size=min(METADATA_FONT_SIZE, width // 40))
+    except TypeError:
+        # Pillow before 10.1 only has a small bitmap font
+        return ImageFont.load_default()
+
+def generate_dataset(images_path, num_cameras, num_legings, images_per_leging, width, height, seed=0):
+    '''
+    Generate the image tree. Every leging is a series of bursts of 1-10 frames, a few seconds apart,
+    with some minutes between the bursts.
+
+    Returns
+    -----
+    image_metadata - dictionary
+        The metadata of every image, like the postprocessing reads it: the key is the path relative
+        to the images folder, the value is the (date, time, camera) tuple
+    '''
+    rng = random.Random(seed)
+    font = load_metadata_font(width)
+    image_metadata = {}
+    for camera_index in range(num_cameras):
+        camera = f'AWC{camera_index:03d}'
+        for leging_index in range(num_legings):
+            leging = f'leging{leging_index + 1}'
+            folder = os.path.join(images_path, camera, leging)
+            os.makedirs(folder, exist_ok=True)
+
+            current = datetime(2024, 4, 1) + timedelta(days=leging_index * 14)
+            burst_left = 0
+            for image_index in range(images_per_leging):
+                if burst_left == 0:
+                    current += timedelta(minutes=rng.randint(2, 120))
+                    burst_left = rng.randint(1, 10)
+                current += timedelta(seconds=rng.randint(1, 5))
+                burst_left -= 1
+
+                filename = f'IMG_{image_index:05d}.JPG'
+                image = Image.new('RGB', (width, height), (rng.randint(40, 120), rng.randint(60, 140), rng.randint(30, 90)))
+                draw = ImageDraw.Draw(image)
+                # A few blobs, so the images are not all the same
+                for _ in range(rng.randint(1, 4)):
+                    x, y = rng.randint(0, width - 100), rng.randint(0, height - IMAGE_METADATA_HEIGHT - 100)
+                    draw.ellipse((x, y, x + rng.randint(40, 300), y + rng.randint(40, 200)), fill=(rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)))
+
+                # The camera writes the month first, the OCR of the postprocessing turns it into day first
+                draw.rectangle((0, height - IMAGE_METADATA_HEIGHT, width, height), fill=(0, 0, 0))
+                text = f'{camera}  065F 18C  {current:%m/%d/%Y} {current:%H:%M:%S}'
+                draw.text((20, height - IMAGE_METADATA_HEIGHT + 35), text, fill=(255, 255, 255), font=font)
+                image.save(os.path.join(folder, filename), quality=90)
+
+                image_metadata[f'{camera}/{leging}/{filename}'] = (f'{current.day}/{current.month}/{current.year}', f'{current:%H:%M:%S}', camera)
+    return image_metadata
+
+def write_synthetic_detections(filepath, image_metadata, width, height, seed=0):
+    '''
+    Write a detection store with 0-3 detections per image, the labels of a burst mostly stay the same
+    '''
+    rng = random.Random(seed)
+    with DetectionStoreWriter(filepath) as detection_store:
+        burst_labels = rng.sample(LABELS, 2)
+        for relative_path in image_metadata:
+            if rng.random() < 0.2:
+                burst_labels = rng.sample(LABELS, rng.randint(1, 3))
+            detections = []
+            for _ in range(rng.randint(0, 3)):
+                category_id, category = rng.choice(burst_labels)
+                x, y = rng.uniform(0, width - 200), rng.uniform(0, height - IMAGE_METADATA_HEIGHT - 200)
+                detections.append((category_id, category, [x, y, rng.uniform(20, 200), rng.uniform(20, 200)], round(rng.uniform(0.2, 1.0), 3)))
+            detection_store.add_image(relative_path, width, height, detections)
+
+def measure(function, repeat, prepare=None):
+    '''
+    Run a function `repeat` times
+
+    Return
+    -----
+    result - any
+        The result of the last run
+    runs - list
+        The seconds of every run
+    '''
+    runs = []
+    result = None
+    for _ in range(repeat):
+        argument = prepare() if prepare is not None else None
+        start = time.perf_counter()
+        result = function(argument) if prepare is not None else function()
+        runs.append(time.perf_counter() - start)
+    return result, runs
+
+def stage_result(runs, num_images, **extra):
+    seconds = statistics.median(runs)
+    return {
+        'status': 'ok',
+        'seconds': round(seconds, 6),
+        'runs': [round(run, 6) for run in runs],
+        'images': num_images,
+        'images_per_second': round(num_images / seconds, 2) if seconds > 0 else None,
+        **extra
+    }
+
+def skipped(reason):
+    return {'status': 'skipped', 'reason': reason}
+
+def failed(reason):
+    return {'status': 'failed', 'reason': reason}
+
+def run_model(model, workdir, num_images, python, batch_size):
+    '''
+    Run a model runner on the CPU, in its own working folder (like /app in its container)
+    '''
+    scripts_path = os.path.join(ROOT_PATH, 'models', model, 'app', 'scripts')
+    if not os.path.exists(os.path.join(scripts_path, MODEL_WEIGHTS[model])):
+        return skipped(f"The weights '{MODEL_WEIGHTS[model]}' are not in {scripts_path}")
+
+    model_workdir = os.path.join(workdir, model)
+    os.makedirs(os.path.join(model_workdir, 'results', model), exist_ok=True)
+    os.symlink(scripts_path, os.path.join(model_workdir, 'scripts'), target_is_directory=True)
+    os.symlink(os.path.join(workdir, 'images'), os.path.join(model_workdir, 'images'), target_is_directory=True)
+
+    environment = dict(os.environ, CUDA_VISIBLE_DEVICES='', RESULT_CACHE='False', BATCH_SIZE=str(batch_size))
+    log_path = os.path.join(model_workdir, 'run.log')
+    start = time.perf_counter()
+    with open(log_path, 'w') as log:
+        process = subprocess.run([python, '-m', 'scripts.main'], cwd=model_workdir, env=environment, stdout=log, stderr=subprocess.STDOUT)
+    seconds = time.perf_counter() - start
+
+    error_path = os.path.join(model_workdir, 'results', model, 'error.log')
+    if process.returncode != 0 or os.path.exists(error_path):
+        with open(log_path) as log:
+            return failed(log.read()[-2000:])
+
+    metrics = None
+    metrics_path = os.path.join(model_workdir, 'results', model, 'metrics.json')
+    if os.path.exists(metrics_path):
+        with open(metrics_path) as file:
+            metrics = json.load(file)
+    return stage_result([seconds], num_images, metrics=metrics)
+
+def run_ocr(workdir, image_metadata, num_images):
+    try:
+        from scripts.postprocessing.metadata_extraction import extract_metadata_parallel
+    except ImportError as error:
+        return skipped(f"The postprocessing dependencies are not installed: {error}")
+    if shutil.which('tesseract') is None:
+        return skipped("tesseract is not installed")
+
+    relative_paths = list(image_metadata)[:num_images]
+    image_paths = [os.path.join(workdir, 'images', relative_path) for relative_path in relative_paths]
+    all_metadata, runs = measure(lambda: extract_metadata_parallel(image_paths), 1)
+
+    # How much of the rendered metadata the OCR reads back
+    correct = sum(metadata == image_metadata[relative_path] for relative_path, metadata in zip(relative_paths, all_metadata))
+    return stage_result(runs, len(image_paths), accuracy=round(correct / len(image_paths), 3) if image_paths else None)
+
+def run_postprocessing(source, results_folder, image_metadata, repeat):
+    '''
+    Time the postprocessing of the detections of a source
+
+    Return
+    -----
+    stages - dictionary
+        The result per stage
+    '''
+    try:
+        from scripts.main import generate_results
+        from scripts.postprocessing.postprocess import remove_duplicates
+        from scripts.postprocessing.stat_generator import get_statistics
+    except ImportError as error:
+        reason = f"The postprocessing dependencies are not installed: {error}"
+        return {f'{stage}/{source}': skipped(reason) for stage in ('join', 'remove_duplicates', 'get_statistics')}
+
+    num_images = len(image_metadata)
+    stages = {}
+    # The images are in 'images' of the current folder, like in the container
+    results, runs = measure(lambda: list(generate_results('images', results_folder, source, image_metadata)), repeat)
+    stages[f'join/{source}'] = stage_result(runs, num_images)
+
+    # remove_duplicates adds fields to the results, every run gets its own copy
+    filtered, runs = measure(remove_duplicates, repeat, prepare=lambda: copy.deepcopy(results))
+    stages[f'remove_duplicates/{source}'] = stage_result(runs, num_images, kept=len(filtered))
+
+    # Like the postprocessing, the statistics are generated from the results without duplicates
+    _, runs = measure(lambda: get_statistics(filtered), repeat)
+    stages[f'get_statistics/{source}'] = stage_result(runs, len(filtered))
+    return stages
+
+def run_gui(source, results_folder, images_path, num_images, repeat):
+    sys.path.insert(0, os.path.join(ROOT_PATH, 'gui'))
+    try:
+        import main as gui_main
+    except ImportError as error:
+        return skipped(f"The GUI dependencies are not installed: {error}")
+    finally:
+        sys.path.pop(0)
+
+    gui_main.RESULTS_PATH = results_folder
+    labeled_images, runs = measure(lambda: gui_main.get_labeled_images(images_path, source), repeat)
+    return stage_result(runs, num_images, labeled_images=len(labeled_images))
+
+def get_version():
+    def git(*arguments):
+        process = subprocess.run(['git', *arguments], cwd=ROOT_PATH, capture_output=True, text=True)
+        return process.stdout.strip() if process.returncode == 0 else None
+
+    commit = git('rev-parse', 'HEAD')
+    return {'commit': commit, 'dirty': bool(git('status', '--porcelain', '--untracked-files=no')) if commit else None}
+
+def compare(report, baseline, threshold):
+    '''
+    Compare the stages to the same stages of a baseline report
+
+    Return
+    -----
+    comparison - dictionary
+        Per stage that ran in both: the seconds of both, the change and if it is a regression
+    '''
+    comparison = {}
+    for name, stage in report['stages'].items():
+        baseline_stage = baseline['stages'].get(name)
+        if stage['status'] != 'ok' or baseline_stage is None or baseline_stage['status'] != 'ok' or baseline_stage['seconds'] == 0:
+            continue
+
+        change = stage['seconds'] / baseline_stage['seconds'] - 1
+        comparison[name] = {
+            'seconds': stage['seconds'],
+            'baseline_seconds': baseline_stage['seconds'],
+            'change': round(change, 4),
+            'regression': change > threshold
+        }
+    return comparison
+
+def print_report(report):
+    print(f"{report['dataset']['images']} images, generated in {report['dataset']['seconds']:.1f} s")
+    for name, stage in report['stages'].items():
+        if stage['status'] == 'ok':
+            line = f"{name:<32} {stage['seconds']:>9.3f} s {stage['images_per_second'] or 0:>10.1f} images/s"
+            comparison = report.get('comparison', {}).get(name)
+            if comparison is not None:
+                line += f"  {comparison['change']:+.1%}" + ('  REGRESSION' if comparison['regression'] else '')
+            print(line)
+        else:
+            print(f"{name:<32} {stage['status']}: {stage['reason'].strip().splitlines()[-1] if stage['reason'].strip() else ''}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cameras', type=int, default=4, help='Amount of cameras')
+    parser.add_argument('--legings', type=int, default=2, help='Amount of legings per camera')
+    parser.add_argument('--images', type=int, default=100, help='Amount of images per leging')
+    parser.add_argument('--width', type=int, default=1920, help='Width of the images')
+    parser.add_argument('--height', type=int, default=1080, help='Height of the images, with the metadata strip')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the dataset and the synthetic detections')
+    parser.add_argument('--models', nargs='*', default=MODELS, choices=MODELS, help='The models to run, none skips the inference')
+    parser.add_argument('--batch-size', type=int, default=8, help='Batch size of the model runners')
+    parser.add_argument('--python', default=sys.executable, help='Python with the dependencies of the model runners')
+    parser.add_argument('--ocr-images', type=int, default=50, help='Amount of images of the OCR stage, 0 skips it')
+    parser.add_argument('--repeat', type=int, default=3, help='Amount of runs of the postprocessing and GUI stages, the median is reported')
+    parser.add_argument('--workdir', help='Folder for the dataset and the results. Defaults to a temporary folder that is removed afterwards')
+    parser.add_argument('--report', help='Path of the JSON report. Defaults to benchmarks/reports/pipeline-<time>.json')
+    parser.add_argument('--baseline', help='Report of another version to compare to')
+    parser.add_argument('--threshold', type=float, default=0.1, help='A stage that got this fraction slower than the baseline is a regression')
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix='benchmark_pipeline_')
+    images_path = os.path.join(workdir, 'images')
+    created_at = datetime.now(timezone.utc)
+    report = {
+        'created_at': created_at.isoformat(),
+        'version': get_version(),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('workdir', 'report', 'baseline', 'python')},
+        'stages': {}
+    }
+
+    previous_folder = os.getcwd()
+    try:
+        start = time.perf_counter()
+        image_metadata = generate_dataset(images_path, args.cameras, args.legings, args.images, args.width, args.height, args.seed)
+        report['dataset'] = {'images': len(image_metadata), 'seconds': round(time.perf_counter() - start, 3)}
+        num_images = len(image_metadata)
+
+        sources = {}
+        for model in args.models:
+            report['stages'][f'inference/{model}'] = run_model(model, workdir, num_images, args.python, args.batch_size)
+            if report['stages'][f'inference/{model}']['status'] == 'ok':
+                sources[model] = os.path.join(workdir, model, 'results')
+
+        # Without a model, the later stages get synthetic detections
+        if len(sources) == 0:
+            sources[SYNTHETIC_SOURCE] = os.path.join(workdir, 'results')
+            write_synthetic_detections(os.path.join(workdir, 'results', SYNTHETIC_SOURCE, 'detections.arrow'), image_metadata, args.width, args.height, args.seed)
+
+        os.chdir(workdir)
+        if args.ocr_images > 0:
+            report['stages']['ocr'] = run_ocr(workdir, image_metadata, args.ocr_images)
+        for source, results_folder in sources.items():
+            report['stages'].update(run_postprocessing(source, results_folder, image_metadata, args.repeat))
+            report['stages'][f'get_labeled_images/{source}'] = run_gui(source, results_folder, images_path, num_images, args.repeat)
+    finally:
+        os.chdir(previous_folder)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            report['comparison'] = compare(report, json.load(file), args.threshold)
+
+    report_path = args.report or os.path.join(REPORTS_PATH, f"pipeline-{created_at:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    with open(report_path, 'w') as file:
+        json.dump(report, file, indent=4)
+
+    print_report(report)
+    print(f"Report written to {report_path}")
@@ -0,0 +1,133 @@
+"""
+Benchmark of the duplicate removal of the postprocessing.
+
+Generates synthetic postprocessing results (bursts of frames per camera) and compares `remove_duplicates`
+with the previous implementation, that filtered the whole dataframe once per batch and once per
+(batch, label) pair, and compared the labels of the images as sets.
+
+The labels of an image are unique in the generated results. `remove_duplicates` compares labels with their
+counts, which only differs from the set comparison when an image has a label more than once, so on these
+results both must keep exactly the same images.
+
+The previous implementation is quadratic, so it only runs up to `--max-reference-rows`.
+
+Run from the root of the project:
+    python -m benchmarks.benchmark_remove_duplicates --rows 200000
+"""
+
+import os
+import sys
+import copy
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'postprocessing', 'app'))
+from scripts.postprocessing import postprocess
+from scripts.postprocessing.postprocess import remove_duplicates
+
+process_labels = getattr(postprocess, '__process_labels')
+
+LABELS = ['duck', 'goose', 'hare', 'crow', 'swan', 'fox', 'heron', 'coot']
+
+def generate_results(num_rows, num_cameras=20, seed=0):
+    '''
+    Generate results like process() returns them: bursts of 1-10 frames, a few seconds apart,
+    with some minutes between bursts
+    '''
+    rng = random.Random(seed)
+    results = []
+    rows_per_camera = num_rows // num_cameras
+    for camera_index in range(num_cameras):
+        camera = f'AWC{camera_index:03d}'
+        current = datetime(2024, 4, 1)
+        while len(results) < (camera_index + 1) * rows_per_camera:
+            current += timedelta(minutes=rng.randint(2, 120))
+            burst_labels = rng.sample(LABELS, rng.randint(1, 3))
+            for _ in range(rng.randint(1, 10)):
+                current += timedelta(seconds=rng.randint(1, 5))
+                # Every label at most once, see the description of the benchmark
+                labels = rng.sample(burst_labels, rng.randint(0, len(burst_labels)))
+                results.append({
+                    'target_filename': f'images/{camera}/leging1/IMG_{len(results):07d}.JPG',
+                    'metadata': {
+                        'date': current.strftime('%d/%m/%Y'),
+                        'time': current.strftime('%H:%M:%S'),
+                        'camera': camera,
+                        'leging': 'leging1'
+                    },
+                    'coco_boxes': [[0, 0, 10, 10]] * len(labels),
+                    'labels': labels,
+                    'scores': [round(rng.random(), 3) for _ in labels]
+                })
+    return results
+
+def reference_get_items_to_keep(batch_list):
+    '''
+    The label rule of the previous implementation: a list of labels is dropped when it is a subset
+    of another list of labels of the batch
+    '''
+    # Sort by length in descending order
+    indexed_lst = sorted(
+        ((index, lst) for index, lst in enumerate(batch_list)),
+        key=lambda x: len(x[1]), reverse=True
+    )
+    
+    reduced_lists = []
+    for index, lst in indexed_lst:
+        if not any(set(lst).issubset(set(other)) for _, other in reduced_lists):
+            reduced_lists.append((index, lst))
+    
+    # Process the labels and return the final result
+    unique_labels = [process_labels(lst) for _, lst in reduced_lists]
+    return unique_labels
+
+def reference_remove_duplicates(to_filter):
+    '''
+    The previous implementation: a boolean mask over the whole dataframe per batch and per (batch, label) pair
+    '''
+    dataframe = getattr(postprocess, '__generate_batches')(to_filter)
+    dataframe = getattr(postprocess, '__generate_average_score')(dataframe)
+    dataframe = getattr(postprocess, '__generate_labels_as_string')(dataframe)
+
+    final_result = []
+    for batch in list(set(dataframe['batch'])):
+        batch_data = dataframe[dataframe['batch'] == batch]
+        final_result.append((batch, reference_get_items_to_keep(batch_data['labels'])))
+
+    filtered_final_list = []
+    for batch, label_list in final_result:
+        for label in label_list:
+            matching_rows = dataframe[(dataframe['batch'] == batch) & (dataframe['label_str'] == label)]
+            if not matching_rows.empty:
+                filtered_final_list.append(matching_rows.loc[matching_rows['avg_score'].idxmax()]['target_filename'])
+
+    return [item for item in to_filter if item['target_filename'] in filtered_final_list]
+
+def time_function(func, results):
+    # remove_duplicates adds columns to the items, so every run gets its own copy
+    results = copy.deepcopy(results)
+    start = time.perf_counter()
+    output = func(results)
+    return time.perf_counter() - start, output
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000, help='Amount of rows of the largest run')
+    parser.add_argument('--max-reference-rows', type=int, default=20000, help='Largest run the previous implementation is timed on')
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'previous (s)':>13} {'groupby (s)':>12} {'speedup':>8} {'kept':>8}")
+    for num_rows in sorted({min(2000, args.rows), min(20000, args.rows), args.rows}):
+        results = generate_results(num_rows)
+
+        new_time, new_output = time_function(remove_duplicates, results)
+        kept = [item['target_filename'] for item in new_output]
+
+        if num_rows <= args.max_reference_rows:
+            reference_time, reference_output = time_function(reference_remove_duplicates, results)
+            assert kept == [item['target_filename'] for item in reference_output], f"Kept images differ for {num_rows} rows"
+            print(f"{len(results):>8} {reference_time:>13.2f} {new_time:>12.2f} {reference_time / new_time:>7.1f}x {len(kept):>8}")
+        else:
+            print(f"{len(results):>8} {'-':>13} {new_time:>12.2f} {'-':>8} {len(kept):>8}")
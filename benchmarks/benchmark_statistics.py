@@ -0,0 +1,52 @@
+"""
+Benchmark of the statistics (stats.json) of the postprocessing.
+
+Generates synthetic postprocessing results and compares `get_statistics`, which aggregates every
+statistic in a single pass, with the previous implementation, that made a pass over the results
+per statistic. Both must return exactly the same statistics.
+
+The results are given to `get_statistics` as a generator, like `process` does without duplicate filtering.
+
+Run from the root of the project:
+    python -m benchmarks.benchmark_statistics --rows 1000000
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'postprocessing', 'app'))
+from scripts.postprocessing import stat_generator
+from scripts.postprocessing.stat_generator import get_statistics
+from benchmarks.benchmark_remove_duplicates import generate_results
+
+def reference_get_statistics(results):
+    '''
+    The previous implementation: a separate pass over the results per statistic
+    '''
+    return {
+        'observations_by_specie': stat_generator.get_animal_count(results),
+        'observations_by_camera': stat_generator.get_animal_observation_total(results, mode='camera'),
+        'observations_by_leging': stat_generator.get_animal_observation_total(results),
+        'species_by_hour': stat_generator.get_species_by_hour(results)
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000, help='Amount of rows of the results')
+    args = parser.parse_args()
+
+    results = generate_results(args.rows)
+
+    start = time.perf_counter()
+    reference_statistics = reference_get_statistics(results)
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    statistics = get_statistics(result for result in results)
+    new_time = time.perf_counter() - start
+
+    assert statistics == reference_statistics, "The statistics differ"
+    assert [list(hours) for hours in statistics['species_by_hour'].values()] == [list(hours) for hours in reference_statistics['species_by_hour'].values()], "The order of the statistics differs"
+    print(f"{len(results)} rows: previous {reference_time:.2f} s, single pass {new_time:.2f} s ({reference_time / new_time:.1f}x)")
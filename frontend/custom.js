@@ -1,16 +1,24 @@
 const MODELS = ['yolo', 'efficient_det'];
-const OPTIONS = ['visualize_annotations', 'visualize_statistics', 'filter_batches'];
+const OPTIONS = ['visualize_annotations', 'visualize_statistics', 'filter_batches', 'use_result_cache', 'export_coco', 'resume', 'keep_models_loaded', 'run_natively'];
 
 const statusElement = document.getElementById('status');
 const imageDirPathInput = document.getElementById('image_dir_path');
 const saveSettingsCheck = document.getElementById('save_settings');
 const submit_button = document.getElementById('submit_button');
+const cancelButton = document.getElementById('cancel_button');
+const FINISHED_JOB_STATUSES = ['done', 'failed', 'cancelled'];
+
+let currentJobId = null;
 
 let modelChecks = {};
 for (const model of MODELS) {
     modelChecks[model] = document.getElementById(model);
 }
 
+// Not part of the form, but kept so saving the settings doesn't overwrite them
+let batchSize = 8;
+let cpuBudget = 0;
+
 let optionChecks = {};
 for (const option of OPTIONS) {
     optionChecks[option] = document.getElementById(option);
@@ -45,6 +53,8 @@ submit_button.addEventListener('click', async () => {
                 models_to_inference: modelsToInference,
                 options: options,
                 save_settings: saveSettings,
+                batch_size: batchSize,
+                cpu_budget: cpuBudget,
             }),
         });
     } catch (error) {
@@ -63,13 +73,80 @@ submit_button.addEventListener('click', async () => {
         return;
     }
 
-    const data = await response.json();
-    console.log(data);
+    const job = await response.json();
+    console.log(job);
 
     statusElement.textContent = "Inference started. Please open up the console window to view progress and potential problems.";
     statusElement.style.display = "block";
+
+    currentJobId = job.id;
+    cancelButton.hidden = false;
+    followJob(job);
 });
 
+cancelButton.addEventListener('click', async () => {
+    if (currentJobId === null) {
+        return;
+    }
+
+    try {
+        await fetch(`http://127.0.0.1:8000/jobs/${currentJobId}/cancel`, { method: 'POST' });
+    } catch (error) {
+        console.error(error);
+        alert('Error: ' + error);
+    }
+});
+
+// Show the live progress of the job until it is finished, then a new job can be started
+function followJob(job) {
+    let status = job.status;
+    let error = job.error;
+    let stages = {};
+    let metrics = {};
+
+    statusElement.style.whiteSpace = 'pre-line';
+    const events = new EventSource(`http://127.0.0.1:8000/jobs/${job.id}/events`);
+
+    events.onmessage = (message) => {
+        const event = JSON.parse(message.data);
+        if (event.type === 'status') {
+            status = event.status;
+            error = event.error;
+        } else if (event.type === 'stage') {
+            stages[event.name] = event.stage;
+        } else if (event.type === 'progress') {
+            metrics[event.name] = event;
+        }
+
+        let lines = [`Job ${status}` + (error ? `. Error: ${error}` : '')];
+        for (const name in stages) {
+            lines.push(`${name}: ${stages[name]}` + (metrics[name] ? `, ${formatMetrics(metrics[name])}` : ''));
+        }
+        statusElement.textContent = lines.join('\n');
+
+        if (event.type === 'status' && FINISHED_JOB_STATUSES.includes(status)) {
+            events.close();
+            currentJobId = null;
+            cancelButton.hidden = true;
+            submit_button.disabled = false;
+        }
+    };
+
+    events.onerror = (error) => {
+        console.error(error);
+    };
+}
+
+function formatMetrics(metrics) {
+    let text = `${metrics.images_done}/${metrics.images_total} images, ${metrics.images_per_second} images/s`;
+    if (metrics.eta_seconds !== null && metrics.state === 'running') {
+        text += `, ETA ${Math.round(metrics.eta_seconds)} s`;
+    }
+
+    const stages = Object.entries(metrics.stages).map(([stage, seconds]) => `${stage} ${seconds.toFixed(1)} s`).join(', ');
+    return stages ? `${text} (${stages})` : text;
+}
+
 async function fetchSettings() {
     let response;
     try {
@@ -93,6 +170,14 @@ async function fetchSettings() {
         imageDirPathInput.value = settings.image_dir_path;
     }
 
+    if (settings.batch_size) {
+        batchSize = settings.batch_size;
+    }
+
+    if (settings.cpu_budget) {
+        cpuBudget = settings.cpu_budget;
+    }
+
     for (const model in modelChecks) {
         modelChecks[model].checked = settings.models_to_inference.includes(model);
     }
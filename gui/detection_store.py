@@ -0,0 +1,183 @@
+"""
+This utility module provides a columnar store with the detections of a run, as an Arrow IPC file.
+
+A COCO annotation JSON has to be parsed completely before a single detection can be used.
+The detection store has one row per detection, and every field is its own column. Readers
+memory map the file and only touch the columns they select, without parsing or copying anything.
+
+Columns:
+- `image_id`: The id of the image, the same as in the COCO export.
+- `path`: The path of the image, relative to the images folder (like `file_name` in `annotations.json`).
+- `width`, `height`: The size of the image.
+- `camera`, `leging`: The first and second folder of the path, or null when the path doesn't have them.
+- `category_id`, `category`: The id and name of the label.
+- `score`: The score of the detection.
+- `bbox_x`, `bbox_y`, `bbox_width`, `bbox_height`: The bounding box, in COCO format.
+
+Images without detections have a single row, in which the detection columns are null.
+So every image of the run is in the store, in the order it was inferred.
+
+Functionality:
+- `DetectionStoreWriter`:
+    Writes the detections image by image, in record batches, so a run never keeps all of them in memory.
+
+- `read_detections`:
+    Memory maps a store and returns the selected columns as a pyarrow Table.
+
+Note: The same module is used by every model runner, the postprocessing and the GUI. Keep the copies in sync.
+"""
+
+import os
+import pyarrow as pa
+
+DETECTION_STORE_SCHEMA = pa.schema([
+    ('image_id', pa.int32()),
+    ('path', pa.string()),
+    ('width', pa.int32()),
+    ('height', pa.int32()),
+    ('camera', pa.string()),
+    ('leging', pa.string()),
+    ('category_id', pa.int16()),
+    ('category', pa.string()),
+    ('score', pa.float64()),
+    ('bbox_x', pa.float64()),
+    ('bbox_y', pa.float64()),
+    ('bbox_width', pa.float64()),
+    ('bbox_height', pa.float64())
+])
+# Amount of rows that are buffered before they are written as a record batch
+RECORD_BATCH_ROWS = 65536
+
+def get_camera_and_leging(path):
+    """
+    Returns
+    -------
+    camera : str or None
+        The first folder of the path, when the path has one
+
+    leging : str or None
+        The second folder of the path, when the path has one
+    """
+    path_components = path.replace(os.sep, '/').split('/')
+    camera = path_components[0] if len(path_components) > 1 else None
+    leging = path_components[1] if len(path_components) > 2 else None
+    return camera, leging
+
+class DetectionStoreWriter:
+    def __init__(self, filepath):
+        """
+        Creates a new store. The file is written under a temporary name, and only gets its real name when
+        the writer is closed, so an interrupted run never leaves a half written store behind.
+
+        Parameters
+        ----------
+        filepath : str
+            The path of the Arrow IPC file
+        """
+        self.filepath = filepath
+        self.temporary_filepath = filepath + '.tmp'
+        self.num_images = 0
+        self.columns = {name: [] for name in DETECTION_STORE_SCHEMA.names}
+
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+        self.writer = pa.ipc.new_file(self.temporary_filepath, DETECTION_STORE_SCHEMA)
+
+    def add_image(self, path, width, height, detections):
+        """
+        Add an image and its detections
+
+        Parameters
+        ----------
+        path : str
+            The path of the image, relative to the images folder
+
+        width : int
+            The width of the image
+
+        height : int
+            The height of the image
+
+        detections : list
+            A (category_id, category, bbox, score) tuple per detection. The bbox is [x, y, width, height].
+
+        Returns
+        -------
+        image_id : int
+            The id the image got in the store
+        """
+        self.num_images += 1
+        camera, leging = get_camera_and_leging(path)
+
+        # An image without detections still gets a row, so it is not lost
+        for category_id, category, bbox, score in (detections or [(None, None, [None] * 4, None)]):
+            self.columns['image_id'].append(self.num_images)
+            self.columns['path'].append(path)
+            self.columns['width'].append(width)
+            self.columns['height'].append(height)
+            self.columns['camera'].append(camera)
+            self.columns['leging'].append(leging)
+            self.columns['category_id'].append(category_id)
+            self.columns['category'].append(category)
+            self.columns['score'].append(score)
+            self.columns['bbox_x'].append(bbox[0])
+            self.columns['bbox_y'].append(bbox[1])
+            self.columns['bbox_width'].append(bbox[2])
+            self.columns['bbox_height'].append(bbox[3])
+
+        if len(self.columns['image_id']) >= RECORD_BATCH_ROWS:
+            self.flush()
+
+        return self.num_images
+
+    def flush(self):
+        if len(self.columns['image_id']) == 0:
+            return
+
+        self.writer.write_batch(pa.record_batch(list(self.columns.values()), schema=DETECTION_STORE_SCHEMA))
+        self.columns = {name: [] for name in DETECTION_STORE_SCHEMA.names}
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        os.replace(self.temporary_filepath, self.filepath)
+
+    def discard(self):
+        """
+        Close the writer without creating the store, for runs that failed
+        """
+        self.writer.close()
+        os.remove(self.temporary_filepath)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, exception_traceback):
+        if exception_type is None:
+            self.close()
+        else:
+            self.discard()
+
+def read_detections(filepath, columns=None):
+    """
+    Memory map a store and read the selected columns.
+    The columns are not copied into memory, the operating system loads the pages that are used.
+
+    Parameters
+    ----------
+    filepath : str
+        The path of the Arrow IPC file
+
+    columns : optional[list]
+        The names of the columns to read. Defaults to all columns.
+
+    Returns
+    -------
+    detections : pyarrow.Table
+        The detections, one row per detection (or per image without detections)
+    """
+    with pa.memory_map(filepath, 'r') as source:
+        detections = pa.ipc.open_file(source).read_all()
+
+    if columns is not None:
+        detections = detections.select(columns)
+    return detections
@@ -1,16 +1,23 @@
 import os
 import sys
 import json
+import time
 import gui
 import traceback
 from PIL import Image
+from detection_store import read_detections
+from stage_metrics import StageMetrics
 
 ERROR_PATH = os.path.join("..", "error.log")
 RESULTS_PATH = os.path.join("..", "results")
 STATS_FILENAME = "stats.json"
+DETECTION_STORE_FILENAME = "detections.arrow"
+METRICS_FILENAME = "gui_metrics.json"
 
 def run():
     try:
+        start = time.perf_counter()
+        metrics = StageMetrics()
         image_dir_path = sys.argv[1]
         visualize_annotations = sys.argv[2] == 'True'
         visualize_statistics = sys.argv[3] == 'True'
@@ -21,10 +28,15 @@ def run():
         gui.put("title", model)
 
         if visualize_annotations:
-            show_annotation_examples(image_dir_path, model)
+            show_annotation_examples(image_dir_path, model, metrics)
         
         if visualize_statistics:
-            show_stats(model)
+            with metrics.measure("load_stats"):
+                show_stats(model)
+
+        # The time until the window shows, the window itself stays open until it is closed
+        metrics.record("startup", time.perf_counter() - start)
+        metrics.write(os.path.join(RESULTS_PATH, model, METRICS_FILENAME))
 
         gui.mainloop()
     except Exception as exception:
@@ -34,8 +46,9 @@ def run():
             file.write(error_message)
         exit(1)
 
-def show_annotation_examples(image_dir_path, model):
-    labeled_images = get_labeled_images(image_dir_path, model)
+def show_annotation_examples(image_dir_path, model, metrics):
+    with metrics.measure("load_detections"):
+        labeled_images = get_labeled_images(image_dir_path, model)
     
     used_categories = set()
     images_to_show = []
@@ -53,41 +66,42 @@ def show_annotation_examples(image_dir_path, model):
             break
     
     for image_to_show in images_to_show:
-        image_to_show["image"] = Image.open(image_to_show["file_path"])
+        with metrics.measure("open_image"):
+            image_to_show["image"] = Image.open(image_to_show["file_path"])
     
     gui.put("annotation_examples", images_to_show)
 
 def get_labeled_images(image_dir_path, model):
-    with open(os.path.join(RESULTS_PATH, model, "annotations.json")) as file:
-        annotations_file = json.load(file)
-    
-    image_entries = annotations_file["images"]
-    annotations = annotations_file["annotations"]
-    categories = {c["id"]: c["name"] for c in annotations_file["categories"]}
+    # The store is memory mapped, and only the needed columns are read
+    detections = read_detections(os.path.join(RESULTS_PATH, model, DETECTION_STORE_FILENAME),
+                                 columns=["image_id", "path", "category", "score", "bbox_x", "bbox_y", "bbox_width", "bbox_height"])
+    columns = detections.to_pydict()
 
+    # The rows of an image are next to each other, in the order the images were inferred
     labeled_images = []
-    for image_entry in image_entries:
-        labeled_image = {}
-        image_path = os.path.normpath(image_entry["file_name"])
-        image_path = os.path.join(image_dir_path, image_path)
-        labeled_image["file_path"] = image_path
+    labeled_image = None
+    for image_id, path, category, score, x, y, width, height in zip(*columns.values()):
+        if labeled_image is None or labeled_image["image_id"] != image_id:
+            labeled_image = {}
+            labeled_image["image_id"] = image_id
+            image_path = os.path.normpath(path)
+            image_path = os.path.join(image_dir_path, image_path)
+            labeled_image["file_path"] = image_path
+            labeled_image["annotations"] = []
+            labeled_image["categories"] = set()
+            labeled_images.append(labeled_image)
 
-        labeled_image["annotations"] = []
-        categories_in_image = set()
-        for annotation in annotations:
-            if annotation["image_id"] == image_entry["id"]:
-                image_annotation = {}
-                image_annotation["bbox"] = annotation["bbox"]
-                image_annotation["score"] = annotation["score"]
-                category = categories[annotation["category_id"]]
-                categories_in_image.add(category)
-                image_annotation["category"] = category
+        # Images without detections only have a row without category
+        if category is None:
+            continue
 
-                labeled_image["annotations"].append(image_annotation)
-        
-        labeled_image["categories"] = categories_in_image
-        
-        labeled_images.append(labeled_image)
+        image_annotation = {}
+        image_annotation["bbox"] = [x, y, width, height]
+        image_annotation["score"] = score
+        labeled_image["categories"].add(category)
+        image_annotation["category"] = category
+
+        labeled_image["annotations"].append(image_annotation)
     
     return labeled_images
 
@@ -97,4 +111,5 @@ def show_stats(model):
     
     gui.put("stats", stats)
 
-run()
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,241 @@
+"""
+Job queue of the orchestrator.
+
+A job is a single run of the pipeline. Jobs are queued, and a worker thread runs them one at a time
+(they share the results folder and the container names). The jobs run off the event loop of the server,
+so the server keeps answering requests, like the status of a job, while a job runs.
+
+Functionality:
+- `Job`:
+    The status, progress and error of a job. The pipeline reports its progress with `set_progress`
+    and `add_event`, and calls `check_cancelled` between its steps.
+    Every change of the job is also kept as an event, so it can be streamed to the frontend (see `events_since`).
+
+- `JobQueue`:
+    Use `submit` to queue a job, `get` to look it up and `cancel` to cancel it.
+
+- `JobCancelled`:
+    Raised by `Job.check_cancelled` when the job was cancelled.
+"""
+
+import time
+import collections
+import uuid
+import queue
+import threading
+import traceback
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATUSES = (DONE, FAILED, CANCELLED)
+
+MAX_JOB_EVENTS = 1000 # The oldest events are dropped, a long run writes a lot of them
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    def __init__(self, settings):
+        """
+        Parameters
+        ----------
+        settings : dict
+            The settings of the run
+        """
+        self.id = uuid.uuid4().hex
+        self.settings = settings
+        self.status = QUEUED
+        self.progress = {}
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.metrics = {}
+        self.timings = {}
+        self.events = collections.deque(maxlen=MAX_JOB_EVENTS)
+        self.next_event_id = 0
+        self.cancel_event = threading.Event()
+        self.lock = threading.RLock()
+
+    def set_status(self, status, error=None):
+        with self.lock:
+            self.status = status
+            self.error = error
+            if status == RUNNING:
+                self.started_at = time.time()
+            elif status in FINISHED_STATUSES:
+                self.finished_at = time.time()
+            self.add_event({'type': 'status', 'status': status, 'error': error})
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+    def set_progress(self, name, stage):
+        """
+        Report the stage a part of the job (like a model) is in
+
+        Parameters
+        ----------
+        name : str
+            The part of the job, like the name of a model
+
+        stage : str
+            The stage it is in, like 'inferring' or 'done'
+        """
+        with self.lock:
+            self.progress[name] = stage
+            self.add_event({'type': 'stage', 'name': name, 'stage': stage})
+
+    def add_event(self, event):
+        """
+        Keep an event of the job. A `progress` event (the progress a model runner reports) is also
+        kept as the latest metrics of its part of the job, and a `timing` event (the seconds a step of
+        the pipeline took) in the timings of the job.
+
+        Parameters
+        ----------
+        event : dict
+            The JSON serializable event, with its `type`. It gets an increasing `id`.
+        """
+        with self.lock:
+            event = {'id': self.next_event_id, **event}
+            self.next_event_id += 1
+            self.events.append(event)
+            if event['type'] == 'progress':
+                self.metrics[event['name']] = event
+            elif event['type'] == 'timing':
+                self.timings[event['name']] = event['seconds']
+
+    def events_since(self, event_id):
+        """
+        Returns
+        -------
+        events : list
+            The kept events with this id or a later one
+        """
+        with self.lock:
+            return [event for event in self.events if event['id'] >= event_id]
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        """
+        Raises
+        ------
+        JobCancelled
+            When the job was cancelled
+        """
+        if self.cancelled:
+            raise JobCancelled(f"Job '{self.id}' was cancelled")
+
+    def to_dict(self):
+        """
+        Returns
+        -------
+        job : dict
+            The JSON serializable status of the job
+        """
+        with self.lock:
+            return {
+                'id': self.id,
+                'status': self.status,
+                'progress': dict(self.progress),
+                'metrics': dict(self.metrics),
+                'timings': dict(self.timings),
+                'error': self.error,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'settings': self.settings
+            }
+
+class JobQueue:
+    def __init__(self, run_job):
+        """
+        Creates the queue and starts its worker thread
+
+        Parameters
+        ----------
+        run_job : callable
+            Runs a job, called with the `Job`. A job fails when it raises an exception.
+        """
+        self.run_job = run_job
+        self.jobs = {}
+        self.pending = queue.Queue()
+        self.worker = threading.Thread(target=self.__work, name='job-worker', daemon=True)
+        self.worker.start()
+
+    def submit(self, settings):
+        """
+        Queue a new job
+
+        Returns
+        -------
+        job : Job
+            The queued job
+        """
+        job = Job(settings)
+        self.jobs[job.id] = job
+        self.pending.put(job)
+        return job
+
+    def get(self, job_id):
+        """
+        Returns
+        -------
+        job : Job or None
+            The job, or None when there is no job with this id
+        """
+        return self.jobs.get(job_id)
+
+    def list(self):
+        return list(self.jobs.values())
+
+    def cancel(self, job_id):
+        """
+        Cancel a job. A queued job never starts, a running job stops at its next `check_cancelled`.
+
+        Returns
+        -------
+        job : Job or None
+            The job, or None when there is no job with this id
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+
+        with job.lock:
+            if job.finished:
+                return job
+
+            job.cancel_event.set()
+            if job.status == QUEUED:
+                job.set_status(CANCELLED)
+        return job
+
+    def __work(self):
+        while True:
+            job = self.pending.get()
+            with job.lock:
+                if job.status == CANCELLED:
+                    continue
+                job.set_status(RUNNING)
+
+            try:
+                self.run_job(job)
+                status, error = DONE, None
+            except Exception as exception:
+                # Stopping the containers of a cancelled job makes its stages fail, that is not an error
+                if job.cancelled:
+                    status, error = CANCELLED, None
+                else:
+                    traceback.print_exc()
+                    status, error = FAILED, str(exception)
+
+            job.set_status(status, error)
@@ -1,16 +1,28 @@
 import subprocess
 import webbrowser
 import os
+import sys
 import yaml
 import platform
 import shutil
-import asyncio
 import traceback
-import signal
+import json
+import time
+import urllib.request
+import urllib.error
+import queue
+import asyncio
+import threading
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from jobs import JobQueue, JobCancelled
 
 """
 We are SO sorry for the monster below!
@@ -32,7 +44,29 @@ NON_CUDA_IMAGE = 'python'
 NON_CUDA_IMAGE_VERSION = '3.10.11-slim'
 RESULTS_PATH = 'results'
 ERROR_FILENAME = 'error.log'
+DETECTION_STORE_FILENAME = 'detections.arrow'
 POSTPROCESSING_PATH = 'postprocessing'
+METADATA_TABLE_FILENAME = 'metadata.arrow'
+METADATA_RESULTS_FOLDER = 'metadata' # The results of the postprocessing stages that are shared by all models
+# The time per image of every stage (see the stage_metrics modules), per part of the pipeline
+METRICS_FILENAMES = {'inference': 'metrics.json', 'postprocessing': 'postprocessing_metrics.json', 'gui': 'gui_metrics.json'}
+METADATA_METRICS_FILENAME = 'metrics.json'
+DEFAULT_BATCH_SIZE = 8
+DEFAULT_CPU_BUDGET = 0 # 0 uses every core Docker has
+MODEL_WORKER_PORTS = {'yolo': 8101, 'efficient_det': 8102}
+MODEL_WORKER_CONTAINER_PORT = 8000
+MODEL_WORKER_STARTUP_TIMEOUT = 600 # Loading the weights can take a while on the first start
+MODEL_WORKER_LABEL = 'wildlife-classifier.worker-config'
+IMAGE_HASH_LABEL = 'wildlife-classifier.context-hash'
+IGNORED_CONTEXT_FOLDERS = ('__pycache__', '.pytest_cache') # Don't change the image, so they don't make it outdated
+HASH_CHUNK_SIZE = 1024 * 1024
+PROGRESS_PATH = os.path.join(RESULTS_PATH, '.progress') # The model runners write their progress events here, one file per model
+PROGRESS_POLL_INTERVAL = 0.5
+EVENT_STREAM_INTERVAL = 0.5
+# With `run_natively`, the stages run without docker, with this Python. It needs the dependencies of the models and the postprocessing
+NATIVE_PYTHON = os.environ.get('NATIVE_PYTHON', sys.executable)
+NATIVE_POLL_INTERVAL = 0.2
+NATIVE_STOP_TIMEOUT = 10 # Seconds a cancelled native stage gets to stop, before it is killed
 
 app = FastAPI()
 
@@ -49,6 +83,8 @@ class PostFormRequest(BaseModel):
     models_to_inference: list[str]
     options: dict[str, bool]
     save_settings: bool
+    batch_size: int = DEFAULT_BATCH_SIZE
+    cpu_budget: int = DEFAULT_CPU_BUDGET
 
 @app.post("/post-form")
 async def post_form(request: PostFormRequest):
@@ -68,32 +104,141 @@ async def post_form(request: PostFormRequest):
     if save_settings == None:
         raise HTTPException(status_code=400, detail="save_settings is required.")
     
+    batch_size = request.batch_size
+    if batch_size < 1:
+        raise HTTPException(status_code=400, detail="batch_size should be at least 1.")
+    
+    cpu_budget = request.cpu_budget
+    if cpu_budget < 0:
+        raise HTTPException(status_code=400, detail="cpu_budget should be 0 (all cores) or more.")
+    
     settings = {
         'image_dir_path': image_dir_path,
         'models_to_inference': models_to_inference,
-        'options': options
+        'options': options,
+        'batch_size': batch_size,
+        'cpu_budget': cpu_budget
     }
     
-    asyncio.create_task(async_start_inference_middleman(settings, save_settings))
-
-async def async_start_inference_middleman(settings, save_settings):
-    # Give FastAPI time to send HTTP response
-    await asyncio.sleep(0.5)
-    handle_exceptions(start_inference, settings, save_settings)
-
-def start_inference(settings, save_settings):
     if save_settings:
         with open(SETTINGS_PATH, 'w') as file:
             yaml.dump(settings, file)
     
+    # The job runs on the worker thread of the queue, so the server keeps answering requests
+    job = job_queue.submit(settings)
+    return job.to_dict()
+
+@app.get("/jobs")
+async def get_jobs():
+    return [job.to_dict() for job in job_queue.list()]
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' does not exist.")
+    
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/events")
+async def get_job_events(job_id: str, request: Request):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' does not exist.")
+    
+    # A reconnecting EventSource continues after the last event it got
+    last_event_id = request.headers.get('last-event-id')
+    event_id = int(last_event_id) + 1 if last_event_id else 0
+    return StreamingResponse(stream_job_events(job, event_id), media_type='text/event-stream')
+
+async def stream_job_events(job, event_id=0):
+    '''
+    Stream the events of a job as Server-Sent Events, until the job is finished
+
+    Parameter
+    -----
+    job - Job
+        The job to stream
+    event_id - int
+        The first event that is sent
+    '''
+    while True:
+        # Checked before the events are read, so the events up to the end of the job are always sent
+        finished = job.finished
+        for event in job.events_since(event_id):
+            yield f"id: {event['id']}\ndata: {json.dumps(event)}\n\n"
+            event_id = event['id'] + 1
+        
+        if finished:
+            return
+        await asyncio.sleep(EVENT_STREAM_INTERVAL)
+
+@app.get("/metrics")
+async def get_metrics():
+    return read_metrics()
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    # A running job stops its containers itself, as soon as it sees it was cancelled
+    job = job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' does not exist.")
+    
+    return job.to_dict()
+
+@app.on_event("shutdown")
+def shutdown():
+    # The warm workers only get the jobs of this server, so they stop with it
+    stop_model_workers()
+
+def read_metrics():
+    '''
+    Read the stage metrics of the latest run of every model, and of the shared metadata stage
+
+    Return
+    -----
+    metrics - dictionary
+        Per model, the metrics of every part of the pipeline that ran ('inference', 'postprocessing'
+        and 'gui'). The metadata stage is under 'metadata'
+    '''
+    metrics = {}
+    metadata_metrics_path = os.path.join(RESULTS_PATH, METADATA_RESULTS_FOLDER, METADATA_METRICS_FILENAME)
+    if os.path.exists(metadata_metrics_path):
+        with open(metadata_metrics_path) as file:
+            metrics['metadata'] = json.load(file)
+    
+    for model in os.listdir(MODELS_PATH):
+        for part, filename in METRICS_FILENAMES.items():
+            metrics_path = os.path.join(RESULTS_PATH, model, filename)
+            if os.path.exists(metrics_path):
+                with open(metrics_path) as file:
+                    metrics.setdefault(model, {})[part] = json.load(file)
+    
+    return metrics
+
+def run_job(job):
+    '''
+    Run the pipeline of a job. The error of a failed job is also written to the error log.
+    '''
+    try:
+        start_inference(job.settings, job)
+    except Exception as exception:
+        if not job.cancelled:
+            with open(ERROR_FILENAME, 'w') as file:
+                file.write(str(exception))
+        raise
+
+job_queue = JobQueue(run_job)
+
+def start_inference(settings, job=None):
     settings["image_dir_path"] = make_absolute(settings["image_dir_path"])
     
-    run_models(settings)
-    run_postprocessing(settings)
-    if settings['options']['visualize_annotations'] or settings['options']['visualize_statistics']:
-        run_gui(settings)
+    with log_duration('Pipeline', job):
+        model_errors = run_pipeline(settings, job)
     
-    os.kill(os.getpid(), signal.SIGTERM)
+    # The models that failed didn't stop the others, their errors are raised at the end
+    if len(model_errors) > 0:
+        raise Exception('\n'.join(str(error) for error in model_errors.values()))
 
 def get_settings(location):
     '''
@@ -136,17 +281,20 @@ def can_use_cuda():
         pass
     return False
 
-def check_results(path, content_check_file='annotations.json'):
+def check_results(path, content_check_file=DETECTION_STORE_FILENAME):
     error_log_path = os.path.join(path, ERROR_FILENAME)
     if os.path.exists(error_log_path):
         with open(error_log_path, 'r') as file:
             error = file.read()
         raise Exception(error)
     
+    if content_check_file is None:
+        return
+    
     content_path = os.path.join(path, content_check_file)
 
     if not os.path.exists(content_path):
-        error_msg_prefix = os.path.basename(path) if content_check_file == "annotations.json" else f"Postprogress {os.path.basename(path)}"
+        error_msg_prefix = os.path.basename(path) if content_check_file == DETECTION_STORE_FILENAME else f"Postprogress {os.path.basename(path)}"
         raise Exception(f"{error_msg_prefix} stopped but did not create '{content_check_file}'")
 
 def make_absolute(path):
@@ -154,102 +302,760 @@ def make_absolute(path):
         return os.path.abspath(path)
     return path
 
-def run_postprocessing(settings):
-    settings_models = settings['models_to_inference']
-    used_models = ','.join(settings_models)
-    filter_batches = settings['options']['filter_batches']
-    results_dir = os.path.abspath(RESULTS_PATH)
+def run_pipeline(settings, job=None):
+    '''
+    Run all stages of the pipeline. Every stage of a model starts as soon as the stage it depends on is done:
+    - The metadata of all images is extracted (OCR) while the models infer, it doesn't depend on the detections.
+      It is written to a metadata table, that the postprocessing of every model joins against
+    - The postprocessing of a model starts as soon as its inference is done, while the other models still infer
+    - The GUI of a model opens as soon as its postprocessing is done
+
+    Parameter
+    -----
+    settings - dictionary
+        The settings of the current run
+    job - Job
+        The job of the run, that gets the progress and can be cancelled. Optional
 
-    subprocess.run(['docker', 'build', '-t', 'postprocess_image'
-                        , '--build-arg', f'IMAGE={NON_CUDA_IMAGE}'
-                        , '--build-arg', f'VERSION={NON_CUDA_IMAGE_VERSION}'
-                        , '--build-arg', f'USED_MODELS={used_models}'
-                        , '--build-arg', f'FILTER_BATCHES={filter_batches}', '.'], cwd=POSTPROCESSING_PATH)
+    Return
+    -----
+    model_errors - dictionary
+        The models that failed (in any stage), with their error. The other models still get all their results
+    '''
+    show_gui = settings['options']['visualize_annotations'] or settings['options']['visualize_statistics']
+    # The postprocessing shares the cores of the CPU budget with the models
+    budget_cores = plan_cpu_slots(1, settings.get('cpu_budget', DEFAULT_CPU_BUDGET), run_natively(settings))[0]
 
-    subprocess.run(['docker', 'run', '--name', 'postprocess_container'
-                            , '--mount', f'type=bind,source={results_dir},target=/app/results'
-                            , '--mount', f'type=bind,source={settings["image_dir_path"]},target=/app/images'
-                            , 'postprocess_image'])
+    postprocessing_futures = {}
+    with ThreadPoolExecutor(max_workers=len(settings['models_to_inference']) + 1) as stage_executor:
+        metadata_future = stage_executor.submit(run_metadata_extraction, settings, budget_cores, job)
 
-    # Stop the containter
-    subprocess.run(['docker', 'stop', 'postprocess_container'])
+        def postprocess_model(model):
+            metadata_future.result()
+            set_progress(job, model, 'postprocessing')
+            run_postprocessing(settings, model, budget_cores, job)
+            set_progress(job, model, 'done')
+            # The GUI is a separate window, the job doesn't wait for it to be closed
+            if show_gui:
+                start_gui(settings, model)
 
-    # Remove the container
-    subprocess.run(['docker', 'rm', 'postprocess_container'])
+        def on_model_done(model):
+            postprocessing_futures[model] = stage_executor.submit(postprocess_model, model)
 
-    for model in settings_models:
-        results_model_path = os.path.join(RESULTS_PATH, model)
-        check_results(results_model_path, content_check_file='stats.json')
+        model_errors = run_models(settings, on_model_done=on_model_done, job=job)
 
-def run_gui(settings):
-    tasks = []
-    for model in settings['models_to_inference']:
-        command = ['poetry', 'run', 'python', '-m', 'main', settings["image_dir_path"], \
-                    str(settings['options']['visualize_annotations']), \
-                    str(settings['options']['visualize_statistics']), \
-                    model]
-        tasks.append(subprocess.Popen(command, cwd='gui'))
+        for model, future in postprocessing_futures.items():
+            try:
+                future.result()
+            except JobCancelled as exception:
+                model_errors[model] = exception
+            except Exception as exception:
+                traceback.print_exc()
+                model_errors[model] = exception
+    
+    for model, error in model_errors.items():
+        set_progress(job, model, 'cancelled' if isinstance(error, JobCancelled) else 'failed')
     
-    for task in tasks:
-        task.wait()
+    return model_errors
 
-def run_models(settings):
+def set_progress(job, name, stage):
+    if job is not None:
+        job.set_progress(name, stage)
+
+@contextmanager
+def follow_progress(model, job):
     '''
-    Run the chosen models in their containers
+    Relay the progress events the runner of a model writes to the job, while the block runs
 
     Parameter
     -----
-    model_options - list
-        A list with the models that needs to be used
+    model - String
+        The name of the model
+    job - Job
+        The job that gets the events. Nothing is followed without a job
     '''
-    use_cuda = can_use_cuda()
-    use = 'GPU' if use_cuda else 'CPU'
-    image = CUDA_IMAGE if use_cuda else NON_CUDA_IMAGE
-    image_version = CUDA_IMAGE_VERSION if use_cuda else NON_CUDA_IMAGE_VERSION
-    results_dir = os.path.abspath(RESULTS_PATH)
+    if job is None:
+        yield
+        return
     
-    for model in settings["models_to_inference"]:
-        model_dockerfile_path = os.path.join(MODELS_PATH, model)
-        
-        results_model_path = os.path.join(RESULTS_PATH, model)
-        if os.path.exists(results_model_path):
-            shutil.rmtree(results_model_path)
-        os.mkdir(results_model_path)
-        open(os.path.join(results_model_path, '.gitkeep'), 'a').close()
+    progress_file = os.path.join(PROGRESS_PATH, f'{model}.jsonl')
+    # The file of the previous run would be relayed before the runner starts a new one
+    if os.path.exists(progress_file):
+        os.remove(progress_file)
+    
+    stop_event = threading.Event()
+    def follow():
+        position = 0
+        while True:
+            stopped = stop_event.wait(PROGRESS_POLL_INTERVAL)
+            position = relay_progress_events(progress_file, position, model, job)
+            if stopped:
+                return
+    
+    thread = threading.Thread(target=follow, name=f'{model}-progress', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop_event.set()
+        thread.join()
 
-        images = subprocess.run(['docker', 'image', 'inspect', f'{model}_image'], stdout=subprocess.PIPE)
+def relay_progress_events(progress_file, position, model, job):
+    '''
+    Relay the new events of a progress file to the job
+
+    Parameter
+    -----
+    progress_file - String
+        The JSON lines file of the runner
+    position - int
+        The amount of bytes of the file that were already relayed
+    model - String
+        The name of the model
+    job - Job
+        The job that gets the events
+
+    Return
+    -----
+    position - int
+        The amount of bytes of the file that are relayed now
+    '''
+    if not os.path.exists(progress_file):
+        return position
+    # The runner started the file again
+    if os.path.getsize(progress_file) < position:
+        position = 0
+    
+    with open(progress_file, 'rb') as file:
+        file.seek(position)
+        data = file.read()
+    
+    # The last line can still be half written, it is relayed the next time
+    complete = data[:data.rfind(b'\n') + 1]
+    for line in complete.splitlines():
+        if line.strip():
+            job.add_event({'type': 'progress', 'name': model, **json.loads(line)})
+    
+    return position + len(complete)
+
+def run_container(command, container_name, job=None):
+    '''
+    Run a container and wait until it stops. When the job is cancelled, the container is stopped.
+    The container is always removed afterwards, also when the job was cancelled, so its name is free for the next job.
+
+    Parameter
+    -----
+    command - list
+        The docker run command
+    container_name - String
+        The name of the container, that is given in the command
+    job - Job
+        The job the container belongs to. Optional
+    '''
+    # A container left behind by a server that was killed would block the name
+    subprocess.run(['docker', 'rm', '-f', container_name], capture_output=True)
+    try:
+        if job is None:
+            subprocess.run(command)
+            return
         
-        check_result = images.stdout
-        if f'{model}_image' not in str(check_result):
-            # Make the image
-            print(f"Docker image '{model}_image' does not exist!")
-            subprocess.run(['docker', 'build', '-t', f'{model}_image'
-                        , '--build-arg', f'USE={use}'
-                        , '--build-arg', f'IMAGE={image}'
-                        , '--build-arg', f'VERSION={image_version}', '.'], cwd=model_dockerfile_path)
-        else:
-            print(f"Docker image '{model}_image' already exists, skipping docker build for that image!")
+        job.check_cancelled()
+        process = subprocess.Popen(command)
+        while process.poll() is None:
+            if job.cancel_event.wait(timeout=1):
+                print(f"Stopping '{container_name}', the job was cancelled")
+                subprocess.run(['docker', 'stop', container_name])
+                break
+        process.wait()
         
-        # Run the container
-        if use_cuda:
-            subprocess.run(['docker', 'run', '--name', f'{model}_container'
-                            , '--mount', f'type=bind,source={results_dir},target=/app/results'
-                            , '--mount', f'type=bind,source={settings["image_dir_path"]},target=/app/images'
-                            , '--gpus', 'all', '-it'
-                            , f'{model}_image'])
-        else:
-            subprocess.run(['docker', 'run', '--name', f'{model}_container'
-                            , '--mount', f'type=bind,source={results_dir},target=/app/results'
-                            , '--mount', f'type=bind,source={settings["image_dir_path"]},target=/app/images'
-                            , f'{model}_image'])
-
+        job.check_cancelled()
+    finally:
         # Stop the containter
-        subprocess.run(['docker', 'stop', f'{model}_container'])
+        subprocess.run(['docker', 'stop', container_name])
 
         # Remove the container
-        subprocess.run(['docker', 'rm', f'{model}_container'])
+        subprocess.run(['docker', 'rm', container_name])
+
+def run_natively(settings):
+    return settings['options'].get('run_natively', False)
+
+def run_native_stage(name, scripts_path, settings, environment, cpu_slot=None, job=None):
+    '''
+    Run a stage without docker, as a Python process on this machine. The process gets the same inputs and
+    outputs as the container: it runs `python -m scripts.main` in a temporary folder that looks like /app
+    of the container, with links to the scripts, the results folder and the image folder.
+
+    Parameter
+    -----
+    name - String
+        The name of the stage, like the name of its container
+    scripts_path - String
+        The scripts folder of the stage, like models/yolo/app/scripts
+    settings - dictionary
+        The settings of the current run
+    environment - dictionary
+        The environment variables of the stage, like the ones of its container
+    cpu_slot - list
+        The cores the stage may use. Defaults to every core
+    job - Job
+        The job the stage belongs to. Optional
+    '''
+    app_path = tempfile.mkdtemp(prefix=f'{name}_')
+    try:
+        for link, target in (('scripts', scripts_path), ('results', RESULTS_PATH), ('images', settings['image_dir_path'])):
+            try:
+                os.symlink(os.path.abspath(target), os.path.join(app_path, link), target_is_directory=True)
+            except OSError as error:
+                raise Exception(f"Can't run '{name}' natively, the link to '{target}' can't be created "
+                                f"(on Windows, symbolic links need developer mode): {error}")
+
+        process_environment = dict(os.environ, **{variable: str(value) for variable, value in environment.items()})
+        with log_duration(f"Running '{name}' natively", job):
+            run_native_process([NATIVE_PYTHON, '-m', 'scripts.main'], name, app_path, process_environment, cpu_slot, job)
+    finally:
+        # Only the links are removed, not the folders they point to
+        shutil.rmtree(app_path, ignore_errors=True)
+
+def run_native_process(command, name, cwd, environment, cpu_slot=None, job=None):
+    '''
+    Run a native process and wait until it stops. When the job is cancelled, the process is stopped.
+
+    Parameter
+    -----
+    command - list
+        The command of the process
+    name - String
+        The name of the stage the process runs
+    cwd - String
+        The working folder of the process
+    environment - dictionary
+        The environment variables of the process
+    cpu_slot - list
+        The cores the process may use, pinned where the OS supports it. Defaults to every core
+    job - Job
+        The job the process belongs to. Optional
+    '''
+    if job is not None:
+        job.check_cancelled()
+
+    process = subprocess.Popen(command, cwd=cwd, env=environment)
+    if cpu_slot is not None and hasattr(os, 'sched_setaffinity'):
+        # The slots are planned on the cores this process may use (see get_native_cpus)
+        native_cpus = get_native_cpus()
+        try:
+            os.sched_setaffinity(process.pid, [native_cpus[core] for core in cpu_slot])
+        except ProcessLookupError:
+            # The process already stopped
+            pass
+
+    if job is None:
+        process.wait()
+        return
+
+    # Waits on the process itself, so a short stage isn't held up by the cancel checks
+    while True:
+        try:
+            process.wait(timeout=NATIVE_POLL_INTERVAL)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+
+        if job.cancelled:
+            print(f"Stopping '{name}', the job was cancelled")
+            process.terminate()
+            try:
+                process.wait(timeout=NATIVE_STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+            break
+
+    job.check_cancelled()
+
+def build_postprocessing_image():
+    # The options (like the models and filter_batches) are passed when the container runs, so they never cause a rebuild
+    build_image('postprocess_image', POSTPROCESSING_PATH, {
+        'IMAGE': NON_CUDA_IMAGE,
+        'VERSION': NON_CUDA_IMAGE_VERSION
+    })
+
+def run_postprocessing_container(settings, container_name, environment, cpu_slot=None, job=None):
+    '''
+    Run the postprocessing image once, and remove the container when it is done.
+    With `run_natively`, the stage runs without docker (see run_native_stage)
+
+    Parameter
+    -----
+    settings - dictionary
+        The settings of the current run
+    container_name - String
+        The name of the container, unique per stage, so stages can run at the same time
+    environment - dictionary
+        The environment variables of the container, they choose the stage
+    cpu_slot - list
+        The cores the container may use. Defaults to every core
+    job - Job
+        The job the container belongs to. Optional
+    '''
+    if run_natively(settings):
+        run_native_stage(container_name, os.path.join(POSTPROCESSING_PATH, 'app', 'scripts'), settings, environment, cpu_slot, job)
+        return
+    
+    results_dir = os.path.abspath(RESULTS_PATH)
+
+    command = ['docker', 'run', '--name', container_name
+                , '--mount', f'type=bind,source={results_dir},target=/app/results'
+                , '--mount', f'type=bind,source={settings["image_dir_path"]},target=/app/images']
+    for name, value in environment.items():
+        command += ['--env', f'{name}={value}']
+    if cpu_slot is not None:
+        command += get_cpu_arguments(cpu_slot)
+    command += ['postprocess_image']
+    with log_duration(f"Running '{container_name}'", job):
+        run_container(command, container_name, job)
+
+def run_metadata_extraction(settings, budget_cores, job=None):
+    '''
+    Extract the metadata of all images, while the models infer.
+    The postprocessing image is built here too, so the build also overlaps with the inference.
+    '''
+    set_progress(job, 'metadata', 'extracting')
+    results_metadata_path = prepare_results_folder(METADATA_RESULTS_FOLDER)
+    if not run_natively(settings):
+        build_postprocessing_image()
+
+    # The OCR pool gets one process per core of the budget, not per core of the machine
+    run_postprocessing_container(settings, 'postprocess_metadata_container', {
+        'STAGE': 'metadata',
+        'OCR_WORKERS': len(budget_cores)
+    }, cpu_slot=budget_cores, job=job)
+
+    check_results(results_metadata_path, content_check_file=METADATA_TABLE_FILENAME)
+    set_progress(job, 'metadata', 'done')
+
+def run_postprocessing(settings, model, budget_cores, job=None):
+    '''
+    Postprocess the results of a single model, as soon as its inference is done
+    '''
+    run_postprocessing_container(settings, f'postprocess_{model}_container', {
+        'STAGE': 'process',
+        'MODELS': model,
+        'FILTER_BATCHES': settings['options']['filter_batches'],
+        'OCR_WORKERS': len(budget_cores)
+    }, cpu_slot=budget_cores, job=job)
+
+    results_model_path = os.path.join(RESULTS_PATH, model)
+    check_results(results_model_path, content_check_file='stats.json')
+
+def start_gui(settings, model):
+    '''
+    Open the GUI of a model, without waiting for it to be closed
+
+    Return
+    -----
+    task - subprocess.Popen
+        The GUI process
+    '''
+    command = ['poetry', 'run', 'python', '-m', 'main', settings["image_dir_path"], \
+                str(settings['options']['visualize_annotations']), \
+                str(settings['options']['visualize_statistics']), \
+                model]
+    return subprocess.Popen(command, cwd='gui')
+
+@contextmanager
+def log_duration(name, job=None):
+    '''
+    Print how long the code in the with block took. With a job, the time is also added to its timings.
+    '''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        print(f"[TIMING] {name}: {seconds:.1f} s")
+        if job is not None:
+            job.add_event({'type': 'timing', 'name': name, 'seconds': round(seconds, 3)})
+
+def hash_build_context(context_path, build_args):
+    '''
+    Hash everything a docker image is built from: the paths and contents of the files in the
+    build context, and the build arguments
+
+    Return
+    -----
+    context_hash - String
+        A hexadecimal hash
+    '''
+    context_hash = hashlib.sha256()
+    context_hash.update(json.dumps(build_args, sort_keys=True).encode())
+
+    for root, dirs, files in os.walk(context_path):
+        # Sorted, so the hash doesn't depend on the order the file system returns
+        dirs[:] = sorted(folder for folder in dirs if folder not in IGNORED_CONTEXT_FOLDERS)
+        for file in sorted(files):
+            file_path = os.path.join(root, file)
+            relative_path = os.path.relpath(file_path, context_path).replace(os.sep, '/')
+            context_hash.update(f'{relative_path}|{os.path.getsize(file_path)}|'.encode())
+            with open(file_path, 'rb') as content:
+                for chunk in iter(lambda: content.read(HASH_CHUNK_SIZE), b''):
+                    context_hash.update(chunk)
+
+    return context_hash.hexdigest()
+
+def build_image(image_name, context_path, build_args):
+    '''
+    Build a docker image, unless the existing image was built from exactly the same files and build arguments.
+    The hash of the build context is stored as a label on the image.
+
+    Parameter
+    -----
+    image_name - String
+        The name of the image
+    context_path - String
+        The folder with the Dockerfile
+    build_args - dictionary
+        The build arguments
+    '''
+    context_hash = hash_build_context(context_path, build_args)
+
+    inspect = subprocess.run(['docker', 'image', 'inspect', '-f', '{{index .Config.Labels "%s"}}' % IMAGE_HASH_LABEL, image_name]
+                             , capture_output=True, text=True)
+    if inspect.returncode == 0 and inspect.stdout.strip() == context_hash:
+        print(f"Docker image '{image_name}' is up to date, skipping docker build for that image!")
+        return
+    
+    print(f"Docker image '{image_name}' does not exist or is outdated!")
+    command = ['docker', 'build', '-t', image_name, '--label', f'{IMAGE_HASH_LABEL}={context_hash}']
+    for name, value in build_args.items():
+        command += ['--build-arg', f'{name}={value}']
+    command += ['.']
+
+    with log_duration(f"Building '{image_name}'"):
+        subprocess.run(command, cwd=context_path, check=True)
+
+def get_image_id(image_name):
+    inspect = subprocess.run(['docker', 'image', 'inspect', '-f', '{{.Id}}', image_name], capture_output=True, text=True)
+    return inspect.stdout.strip()
+
+def build_model_image(model, use_cuda):
+    '''
+    Build the docker image of a model, if it doesn't exist yet or its code or dependencies changed
+
+    Parameter
+    -----
+    model - String
+        The name of the model
+    use_cuda - bool
+        If the image should be able to use the GPU
+    '''
+    build_image(f'{model}_image', os.path.join(MODELS_PATH, model), {
+        'USE': 'GPU' if use_cuda else 'CPU',
+        'IMAGE': CUDA_IMAGE if use_cuda else NON_CUDA_IMAGE,
+        'VERSION': CUDA_IMAGE_VERSION if use_cuda else NON_CUDA_IMAGE_VERSION
+    })
+
+def prepare_results_folder(model):
+    results_model_path = os.path.join(RESULTS_PATH, model)
+    if os.path.exists(results_model_path):
+        shutil.rmtree(results_model_path)
+    os.mkdir(results_model_path)
+    open(os.path.join(results_model_path, '.gitkeep'), 'a').close()
+    return results_model_path
+
+def get_docker_cpu_count():
+    '''
+    Get the amount of cores Docker can use. On Windows and macOS, Docker runs in a VM that
+    can have less cores than the machine.
+    '''
+    info = subprocess.run(['docker', 'info', '--format', '{{.NCPU}}'], capture_output=True, text=True)
+    try:
+        return int(info.stdout.strip())
+    except ValueError:
+        return os.cpu_count() or 1
+
+def plan_cpu_slots(num_models, cpu_budget=DEFAULT_CPU_BUDGET, native=False):
+    '''
+    Split the CPU budget into slots, so every model that runs at the same time gets its own cores
+
+    Parameter
+    -----
+    num_models - int
+        The amount of models that have to run
+    cpu_budget - int
+        The amount of cores that may be used. 0 uses every core Docker has
+    native - bool
+        If the stages run natively, then the cores of this machine are split instead of the cores of Docker
+
+    Return
+    -----
+    cpu_slots - list
+        A list of core lists. There are never more slots than cores, so when there are more models
+        than cores, some models wait for a slot
+    '''
+    num_cpus = len(get_native_cpus()) if native else get_docker_cpu_count()
+    cpu_budget = min(cpu_budget, num_cpus) if cpu_budget > 0 else num_cpus
+    num_slots = max(1, min(num_models, cpu_budget))
+
+    # The cores that are left after an even split go to the first slots
+    cpu_slots = []
+    first_core = 0
+    for slot in range(num_slots):
+        num_slot_cores = cpu_budget // num_slots + (1 if slot < cpu_budget % num_slots else 0)
+        cpu_slots.append(list(range(first_core, first_core + num_slot_cores)))
+        first_core += num_slot_cores
+    return cpu_slots
+
+def get_native_cpus():
+    '''
+    Get the cores this process may use, the slots of a native run are taken from them
+    '''
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def get_cpuset(cpu_slot):
+    return str(cpu_slot[0]) if len(cpu_slot) == 1 else f'{cpu_slot[0]}-{cpu_slot[-1]}'
+
+def get_cpu_arguments(cpu_slot):
+    '''
+    Get the docker run arguments that pin a container to the cores of a slot
+    '''
+    return ['--cpus', str(len(cpu_slot)), '--cpuset-cpus', get_cpuset(cpu_slot)]
+
+def run_models(settings, on_model_done=None, job=None):
+    '''
+    Run the chosen models in their containers. The models run at the same time, each on its own cores.
 
+    Parameter
+    -----
+    settings - dictionary
+        The settings of the current run. The models come from 'models_to_inference', the
+        amount of cores from 'cpu_budget'
+    on_model_done - callable
+        Called with the name of a model as soon as its results are ready, to start its next stage
+    job - Job
+        The job of the run, that gets the progress and can be cancelled. Optional
+
+    Return
+    -----
+    model_errors - dictionary
+        The models that failed, with their error. The results of the other models are complete
+    '''
+    use_cuda = can_use_cuda()
+    models = settings["models_to_inference"]
+    cpu_slots = plan_cpu_slots(len(models), settings.get('cpu_budget', DEFAULT_CPU_BUDGET), run_natively(settings))
+
+    # A model takes a free slot when it starts, and gives it back when it is done
+    free_cpu_slots = queue.Queue()
+    for cpu_slot in cpu_slots:
+        free_cpu_slots.put(cpu_slot)
+
+    for model in models:
+        set_progress(job, model, 'queued')
+
+    def run_scheduled_model(model):
+        cpu_slot = free_cpu_slots.get()
+        try:
+            if job is not None:
+                job.check_cancelled()
+            print(f"Running '{model}' on cores {get_cpuset(cpu_slot)}")
+            set_progress(job, model, 'inferring')
+            run_model(model, settings, use_cuda, cpu_slot, job)
+        finally:
+            free_cpu_slots.put(cpu_slot)
+
+        if on_model_done is not None:
+            on_model_done(model)
+
+    model_errors = {}
+    with ThreadPoolExecutor(max_workers=len(cpu_slots)) as executor:
+        futures = {model: executor.submit(run_scheduled_model, model) for model in models}
+        for model, future in futures.items():
+            try:
+                future.result()
+            except JobCancelled as exception:
+                model_errors[model] = exception
+            except Exception as exception:
+                traceback.print_exc()
+                model_errors[model] = exception
+
+    return model_errors
+
+def run_model(model, settings, use_cuda, cpu_slot, job=None):
+    '''
+    Run a single model in its container, and check its results.
+    With `run_natively`, the model runs without docker (see run_native_stage)
+
+    Parameter
+    -----
+    model - String
+        The name of the model
+    settings - dictionary
+        The settings of the current run
+    use_cuda - bool
+        If the container should use the GPU
+    cpu_slot - list
+        The cores the container may use
+    job - Job
+        The job the container belongs to. Optional
+    '''
+    results_dir = os.path.abspath(RESULTS_PATH)
+    batch_size = settings.get('batch_size', DEFAULT_BATCH_SIZE)
+    keep_models_loaded = settings['options'].get('keep_models_loaded', False)
+    use_result_cache = settings['options'].get('use_result_cache', True)
+    export_coco = settings['options'].get('export_coco', True)
+    resume = settings['options'].get('resume', False)
+
+    results_model_path = prepare_results_folder(model)
+    # The options of the run are passed to the runner as environment variables
+    environment = {
+        'BATCH_SIZE': batch_size,
+        'RESULT_CACHE': use_result_cache,
+        'COCO_EXPORT': export_coco,
+        'RESUME': resume,
+        'IMAGE_SOURCE': settings["image_dir_path"]
+    }
+
+    if run_natively(settings):
+        # There is no container to keep loaded, so a native run ignores keep_models_loaded
+        with follow_progress(model, job):
+            run_native_stage(model, os.path.join(MODELS_PATH, model, 'app', 'scripts'), settings, environment, cpu_slot, job)
         check_results(results_model_path)
+        return
+
+    build_model_image(model, use_cuda)
+
+    if keep_models_loaded:
+        # Send the job to a warm worker, that already has the weights loaded
+        worker_url = get_model_worker(model, settings, use_cuda, cpu_slot)
+        with log_duration(f"Running '{model}' on its worker", job), follow_progress(model, job):
+            run_model_job(worker_url, {'image_dir': 'images', 'use_cache': use_result_cache, 'export_coco': export_coco, 'resume': resume})
+        # A job on a worker can't be stopped halfway, it is cancelled as soon as it is done
+        if job is not None:
+            job.check_cancelled()
+        check_results(results_model_path)
+        return
+    
+    # Run the container
+    command = ['docker', 'run', '--name', f'{model}_container'
+                , '--mount', f'type=bind,source={results_dir},target=/app/results'
+                , '--mount', f'type=bind,source={settings["image_dir_path"]},target=/app/images']
+    for name, value in environment.items():
+        command += ['--env', f'{name}={value}']
+    command += get_cpu_arguments(cpu_slot)
+    if use_cuda:
+        command += ['--gpus', 'all']
+    command += [f'{model}_image']
+    with log_duration(f"Running '{model}'", job), follow_progress(model, job):
+        run_container(command, f'{model}_container', job)
+
+    check_results(results_model_path)
+
+def get_model_worker(model, settings, use_cuda, cpu_slot):
+    '''
+    Get a running worker container for a model. A running worker is reused when it was started
+    with the same image, image folder, batch size and cores, otherwise it is replaced by a new one.
+
+    Parameter
+    -----
+    model - String
+        The name of the model
+    settings - dictionary
+        The settings of the current run
+    use_cuda - bool
+        If the worker should use the GPU
+    cpu_slot - list
+        The cores the worker may use
+
+    Return
+    -----
+    worker_url - String
+        The url the worker listens on
+    '''
+    container_name = f'{model}_worker'
+    port = MODEL_WORKER_PORTS[model]
+    worker_url = f'http://127.0.0.1:{port}'
+    worker_config = json.dumps({
+        'image_dir_path': settings['image_dir_path'],
+        'batch_size': settings.get('batch_size', DEFAULT_BATCH_SIZE),
+        'use_cuda': use_cuda,
+        'cpu_slot': cpu_slot,
+        'image_id': get_image_id(f'{model}_image')
+    }, sort_keys=True)
+
+    inspect = subprocess.run(['docker', 'inspect', '-f', '{{.State.Running}} {{index .Config.Labels "%s"}}' % MODEL_WORKER_LABEL, container_name]
+                             , capture_output=True, text=True)
+    if inspect.returncode == 0:
+        running, _, running_config = inspect.stdout.strip().partition(' ')
+        if running == 'true' and running_config == worker_config:
+            print(f"Reusing warm worker '{container_name}'")
+            return worker_url
+        
+        print(f"Worker '{container_name}' is outdated or stopped, replacing it")
+        subprocess.run(['docker', 'rm', '-f', container_name])
+
+    results_dir = os.path.abspath(RESULTS_PATH)
+    command = ['docker', 'run', '-d', '--name', container_name
+                , '--label', f'{MODEL_WORKER_LABEL}={worker_config}'
+                , '--mount', f'type=bind,source={results_dir},target=/app/results'
+                , '--mount', f'type=bind,source={settings["image_dir_path"]},target=/app/images'
+                , '--env', f'BATCH_SIZE={settings.get("batch_size", DEFAULT_BATCH_SIZE)}'
+                , '--env', f'IMAGE_SOURCE={settings["image_dir_path"]}'
+                , '--publish', f'127.0.0.1:{port}:{MODEL_WORKER_CONTAINER_PORT}']
+    command += get_cpu_arguments(cpu_slot)
+    if use_cuda:
+        command += ['--gpus', 'all']
+    command += [f'{model}_image', 'poetry', 'run', 'python', '-m', 'scripts.server']
+    subprocess.run(command, check=True)
+
+    wait_for_model_worker(worker_url, container_name)
+    return worker_url
+
+def wait_for_model_worker(worker_url, container_name, timeout=MODEL_WORKER_STARTUP_TIMEOUT):
+    '''
+    Wait until a worker has loaded its model and answers on its health endpoint
+    '''
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'{worker_url}/health', timeout=5) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError):
+            pass
+
+        inspect = subprocess.run(['docker', 'inspect', '-f', '{{.State.Running}}', container_name], capture_output=True, text=True)
+        if inspect.stdout.strip() != 'true':
+            logs = subprocess.run(['docker', 'logs', '--tail', '20', container_name], capture_output=True, text=True)
+            raise Exception(f"Worker '{container_name}' stopped while starting:\n{logs.stdout}{logs.stderr}")
+        
+        time.sleep(1)
+    
+    raise Exception(f"Worker '{container_name}' did not become ready within {timeout} seconds")
+
+def run_model_job(worker_url, job):
+    '''
+    Send an inference job to a worker and wait until it is done.
+    When the job fails, the worker writes its error.log, which is picked up by check_results.
+    '''
+    request = urllib.request.Request(f'{worker_url}/infer', data=json.dumps(job).encode()
+                                     , headers={'Content-Type': 'application/json'}, method='POST')
+    try:
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as error:
+        return json.load(error)
+
+def stop_model_workers():
+    '''
+    Stop and remove all worker containers
+    '''
+    # A machine that only runs natively doesn't need docker
+    if shutil.which('docker') is None:
+        return
+    
+    for model in MODEL_WORKER_PORTS:
+        subprocess.run(['docker', 'rm', '-f', f'{model}_worker'], capture_output=True)
 
 def prepare():
     if os.path.exists(ERROR_FILENAME):
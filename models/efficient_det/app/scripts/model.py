@@ -1,9 +1,14 @@
+import time
 import torchvision.transforms as transforms
 import torch
+import numpy as np
 from torch.backends import cudnn
 from .efficientdet.backbone import EfficientDetBackbone
-from .efficientdet.efficientdet_utils import preprocess, postprocess, STANDARD_COLORS
+from .efficientdet.efficientdet_utils import preprocess, preprocess_decoded, postprocess, STANDARD_COLORS
 from .efficientdet.utils import BBoxTransform, ClipBoxes
+from .config.constants import SCORE_THRESHOLD, IOU_THRESHOLD
+
+WEIGHTS_PATH = 'scripts/efficientdet-d2_188_63500.pth'
 
 def create_model_effdet(device):
     compound_coef = 2
@@ -20,27 +25,70 @@ def create_model_effdet(device):
 
     model = EfficientDetBackbone(compound_coef=compound_coef, num_classes=len(obj_list),
                                 ratios=anchor_ratios, scales=anchor_scales)
-    model.load_state_dict(torch.load('scripts/efficientdet-d2_188_63500.pth', map_location='cpu'))
+    model.load_state_dict(torch.load(WEIGHTS_PATH, map_location='cpu'))
     model.requires_grad_(False)
     model.to(device)
 
     return model
 
+def effdet_preprocess(image, compound_coef=2, force_input_size=None):
+    '''
+    Resize, pad and normalize an image, so it can be given to the model
+
+    Parameters
+    ----------
+    image : str or np.ndarray
+        The path of the image, or the already decoded image (BGR, as returned by cv2.imread).
+        Pass the decoded image when it is already in memory, so the file isn't decoded a second time.
+
+    Returns
+    -------
+    framed_img : np.ndarray
+        The preprocessed image
+    '''
+    input_sizes = [512, 640, 768, 896, 1024, 1280, 1280, 1536, 1536]
+    input_size = input_sizes[compound_coef] if force_input_size is None else force_input_size
+    if isinstance(image, np.ndarray):
+        ori_imgs, framed_imgs, framed_metas = preprocess_decoded(image, max_size=input_size)
+    else:
+        ori_imgs, framed_imgs, framed_metas = preprocess(image, max_size=input_size)
+
+    return framed_imgs[0]
+
 def effdet_infer_on_image(model, image, device):
+    if not isinstance(image, np.ndarray):
+        print(image)
+
+    framed_img = effdet_preprocess(image)
+
+    return effdet_infer_on_batch(model, [framed_img], device)[0]
+
+def effdet_infer_on_batch(model, framed_imgs, device, metrics=None):
+    '''
+    Run the model on a list of preprocessed images at once
+
+    Parameters
+    ----------
+    model : EfficientDetBackbone
+        The loaded model
+    framed_imgs : list
+        The images, as returned by `effdet_preprocess`
+    device : torch.device
+        The device the model runs on
+    metrics : StageMetrics
+        Records the `forward` and `nms` (the postprocessing of the model) stages. Optional
+
+    Returns
+    -------
+    predictions : list
+        A (boxes, labels, scores) tuple per image, in the same order as `framed_imgs`
+    '''
     model.eval()
 
-    print(image)
-
     use_cuda = True
     use_float16 = False
-    force_input_size = None
-    compound_coef = 2
-    threshold = 0.1
-    iou_threshold = 0.1
-
-    input_sizes = [512, 640, 768, 896, 1024, 1280, 1280, 1536, 1536]
-    input_size = input_sizes[compound_coef] if force_input_size is None else force_input_size
-    ori_imgs, framed_imgs, framed_metas = preprocess(image, max_size=input_size)
+    threshold = SCORE_THRESHOLD
+    iou_threshold = IOU_THRESHOLD
 
     if use_cuda:
         x = torch.stack([torch.from_numpy(fi).cpu() for fi in framed_imgs], 0)
@@ -55,7 +103,9 @@ def effdet_infer_on_image(model, image, device):
         model = model.half()
 
     with torch.no_grad():
+        forward_start = time.perf_counter()
         features, regression, classification, anchors = model(x)
+        nms_start = time.perf_counter()
 
         regressBoxes = BBoxTransform()
         clipBoxes = ClipBoxes()
@@ -65,10 +115,7 @@ def effdet_infer_on_image(model, image, device):
                         regressBoxes, clipBoxes,
                         threshold, iou_threshold)
 
-    out=out[0]
-
-    boxes = out['rois']
-    labels = out['class_ids']
-    scores = out['scores']
-
-    return boxes, labels, scores
+    if metrics is not None:
+        metrics.record('forward', nms_start - forward_start, len(framed_imgs))
+        metrics.record('nms', time.perf_counter() - nms_start, len(framed_imgs))
+    return [(o['rois'], o['class_ids'], o['scores']) for o in out]
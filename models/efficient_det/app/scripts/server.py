@@ -0,0 +1,129 @@
+"""
+Long-lived inference worker for the EfficientDet model.
+
+Instead of loading the weights for every run (`python -m scripts.main`), the worker loads them once
+and then accepts inference jobs over HTTP until the container is stopped.
+
+Endpoints:
+- `GET /health`: Returns 200 as soon as the model is loaded.
+- `POST /infer`: Runs inference and writes the results to `results/efficient_det`, exactly like `scripts.main` does.
+    The JSON body can contain:
+    - `image_dir`: The folder (inside `images`) that is searched recursively for images. Defaults to `images`.
+    - `image_paths`: A list of image paths (inside `images`). When given, only these images are inferred.
+    - `use_cache`: If the result cache is used. Defaults to the `RESULT_CACHE` environment variable.
+    - `export_coco`: If the COCO annotation files are written next to the detection store. Defaults to the `COCO_EXPORT` environment variable.
+    - `resume`: If an interrupted job continues from its checkpoint. Defaults to the `RESUME` environment variable.
+
+Jobs are handled one at a time. A job that arrives while another one is running waits for it to finish.
+
+Start it with:
+    poetry run python -m scripts.server
+"""
+
+import os
+import json
+import threading
+import traceback
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from .main import load_model, infer as run
+
+MODEL_NAME = 'efficient_det'
+HOST = '0.0.0.0'
+PORT = int(os.environ.get('WORKER_PORT', 8000))
+IMAGES_PATH = 'images'
+RESULTS_PATH = os.path.join('results', MODEL_NAME)
+ERROR_FILENAME = 'error.log'
+
+model = None
+device = None
+job_lock = threading.Lock()
+
+def is_inside_images(path):
+    path = os.path.normpath(path)
+    return path == IMAGES_PATH or path.startswith(IMAGES_PATH + os.sep)
+
+def run_job(job):
+    '''
+    Run a single inference job with the already loaded model
+
+    Parameters
+    ----------
+        job: dictionary
+            The JSON body of the request
+
+    Returns
+    -------
+        result: dictionary
+            Information about the finished job
+    '''
+    image_dir = job.get('image_dir', IMAGES_PATH)
+    image_paths = job.get('image_paths')
+
+    if not is_inside_images(image_dir):
+        raise ValueError(f"image_dir '{image_dir}' is not inside '{IMAGES_PATH}'")
+    if image_paths is not None:
+        outside = [path for path in image_paths if not is_inside_images(path)]
+        if len(outside) > 0:
+            raise ValueError(f"{len(outside)} image path(s) are not inside '{IMAGES_PATH}', for example '{outside[0]}'")
+
+    error_log_path = os.path.join(RESULTS_PATH, ERROR_FILENAME)
+    if os.path.exists(error_log_path):
+        os.remove(error_log_path)
+
+    run(model, device, image_dir=image_dir, image_paths=image_paths, use_cache=job.get('use_cache'), coco=job.get('export_coco'), resume=job.get('resume'))
+
+    return {'status': 'done', 'model': MODEL_NAME}
+
+class WorkerRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/health':
+            self.send_json(404, {'status': 'error', 'error': f"Unknown path '{self.path}'"})
+            return
+
+        self.send_json(200, {'status': 'ready', 'model': MODEL_NAME, 'busy': job_lock.locked()})
+
+    def do_POST(self):
+        if self.path != '/infer':
+            self.send_json(404, {'status': 'error', 'error': f"Unknown path '{self.path}'"})
+            return
+
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+            job = json.loads(self.rfile.read(content_length) or b'{}')
+        except ValueError as exception:
+            self.send_json(400, {'status': 'error', 'error': f"Invalid JSON body: {exception}"})
+            return
+
+        with job_lock:
+            try:
+                result = run_job(job)
+            except Exception as exception:
+                traceback.print_exc()
+                error_message = f'[{MODEL_NAME.upper()}]: {str(exception)}'
+                os.makedirs(RESULTS_PATH, exist_ok=True)
+                with open(os.path.join(RESULTS_PATH, ERROR_FILENAME), 'w') as file:
+                    file.write(error_message)
+                self.send_json(500, {'status': 'error', 'error': error_message})
+                return
+
+        self.send_json(200, result)
+
+    def send_json(self, status_code, body):
+        content = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+def serve():
+    global model, device
+
+    model, device = load_model()
+
+    server = ThreadingHTTPServer((HOST, PORT), WorkerRequestHandler)
+    print(f"{MODEL_NAME} worker listening on port {PORT}")
+    server.serve_forever()
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,46 @@
+"""
+This utility module contains the function that the image prefetcher uses to load images for the EfficientDet model.
+
+It lives in its own module (instead of `main.py`) so it can be pickled and used by a process pool.
+"""
+
+import time
+import cv2
+from ..model import effdet_preprocess
+
+def load_image(file_path):
+    """
+    Decodes an image and preprocesses it for the model.
+    The image is decoded exactly once; its size is taken from the decoded array.
+
+    Parameters
+    ----------
+    file_path : str
+        The path of the image
+
+    Returns
+    -------
+    framed_img : np.ndarray
+        The resized, padded and normalized image
+
+    width : int
+        The width of the original image
+
+    height : int
+        The height of the original image
+
+    timings : dict
+        The seconds the `decode` and `preprocess` stages took. They are returned instead of recorded,
+        so they also reach the run when the image is loaded in another process.
+    """
+    decode_start = time.perf_counter()
+    image = cv2.imread(file_path)
+    if image is None:
+        raise ValueError(f"Could not decode image '{file_path}'")
+
+    height, width = image.shape[:2]
+    preprocess_start = time.perf_counter()
+    framed_img = effdet_preprocess(image)
+    preprocess_end = time.perf_counter()
+
+    return framed_img, width, height, {'decode': preprocess_start - decode_start, 'preprocess': preprocess_end - preprocess_start}
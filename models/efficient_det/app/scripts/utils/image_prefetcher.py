@@ -0,0 +1,128 @@
+"""
+This utility module provides a bounded producer/consumer pipeline that decodes images ahead of the model.
+
+While the model is busy with the current batch, a pool of workers already decodes (and preprocesses)
+the next images, so the model isn't left idle waiting on disk I/O and JPEG decoding.
+
+Functionality:
+- `ImagePrefetcher`:
+    Iterates over file paths and yields the loaded images in the original order.
+    The amount of images that are loaded ahead is bounded by `queue_depth`.
+
+- `iterate_batches`:
+    Groups the items of any iterable into lists of a fixed size.
+
+Usage Example:
+    prefetcher = ImagePrefetcher(file_paths, load_function, num_workers=4, queue_depth=16)
+    for file_path, loaded in prefetcher:
+        ...
+
+Note: The same module is used by every model runner. Keep the copies in sync.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+class ImagePrefetcher:
+    def __init__(self, file_paths, load_function, num_workers=2, queue_depth=16, use_processes=False):
+        """
+        Initializes the prefetcher
+
+        Parameters
+        ----------
+        file_paths : list
+            The paths of the images to load, in the order they should be yielded.
+
+        load_function : callable
+            Function that gets a file path and returns the loaded image (in whatever form the model needs).
+            Must be a module level function when `use_processes` is True, so it can be pickled.
+
+        num_workers : optional[int]
+            The amount of threads/processes that load images. Defaults to 2.
+
+        queue_depth : optional[int]
+            The maximum amount of images that are loaded ahead of the consumer. Defaults to 16.
+
+        use_processes : optional[bool]
+            Use a process pool instead of a thread pool. Useful when the load function holds the GIL. Defaults to False.
+        """
+        if num_workers < 1:
+            raise ValueError(f"num_workers should be at least 1, but got {num_workers}")
+        if queue_depth < 1:
+            raise ValueError(f"queue_depth should be at least 1, but got {queue_depth}")
+
+        self.file_paths = list(file_paths)
+        self.load_function = load_function
+        self.num_workers = num_workers
+        self.queue_depth = queue_depth
+        self.use_processes = use_processes
+
+    def __len__(self):
+        return len(self.file_paths)
+
+    def __iter__(self):
+        """
+        Yields
+        ------
+        file_path : str
+            The path of the loaded image
+
+        loaded : any
+            The result of `load_function` for that path
+        """
+        executor_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        with executor_class(max_workers=self.num_workers) as executor:
+            pending = deque()
+            file_paths = iter(self.file_paths)
+
+            # Fill the queue up front
+            for file_path in file_paths:
+                pending.append((file_path, executor.submit(self.load_function, file_path)))
+                if len(pending) >= self.queue_depth:
+                    break
+
+            try:
+                while pending:
+                    file_path, future = pending.popleft()
+                    loaded = future.result()
+
+                    # Keep the queue at its depth by loading a new image for each one that is consumed
+                    next_file_path = next(file_paths, None)
+                    if next_file_path is not None:
+                        pending.append((next_file_path, executor.submit(self.load_function, next_file_path)))
+
+                    yield file_path, loaded
+            finally:
+                # Don't load the rest of the images if the consumer stopped early
+                for _, future in pending:
+                    future.cancel()
+
+def iterate_batches(iterable, batch_size):
+    """
+    Groups the items of an iterable into lists of `batch_size` items. The last list can be smaller.
+
+    Parameters
+    ----------
+    iterable : iterable
+        The items to group
+
+    batch_size : int
+        The amount of items per list
+
+    Yields
+    ------
+    batch : list
+        The next group of items
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size should be at least 1, but got {batch_size}")
+
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
@@ -0,0 +1,130 @@
+"""
+This utility module reports the progress of an inference run, so the run can be followed while it is going.
+
+The progress is written as events to a JSON lines file in the results folder, one event per line. The
+orchestrator follows the file while the runner is busy, and relays the events to the frontend.
+A `running` event is written at most every `interval` seconds, so a fast run doesn't flood the file.
+
+Every event has:
+- `state`: `started`, `running`, `done` or `failed`.
+- `time`: The unix time of the event.
+- `images_done`, `images_total`: The finished images (inferred, cached or from the checkpoint) and all images of the run.
+- `images_inferred`: The finished images that went through the model.
+- `seconds`: The seconds since the start of the run.
+- `images_per_second`: The finished images per second since the start of the run.
+- `eta_seconds`: The estimated seconds until the run is done, or None when it can't be estimated yet.
+- `stages`: The seconds spent per stage of the run so far, from the `StageMetrics` of the run.
+
+Functionality:
+- `ProgressReporter`:
+    Use `start` when the amount of images is known, `advance` when images are finished, and `finish`
+    at the end of the run. `totals` has the totals of the run, without the stages.
+
+Note: The same module is used by every model runner. Keep the copies in sync.
+"""
+
+import os
+import json
+import time
+
+class ProgressReporter:
+    def __init__(self, filepath, metrics=None, interval=1.0):
+        """
+        Starts a new progress file
+
+        Parameters
+        ----------
+        filepath : str
+            The path of the JSON lines file
+
+        metrics : optional[StageMetrics]
+            The stage times of the run, that are added to the events
+
+        interval : optional[float]
+            The minimum amount of seconds between two `running` events. Defaults to 1.0.
+        """
+        self.interval = interval
+        self.images_total = 0
+        self.images_done = 0
+        self.images_inferred = 0
+        self.metrics = metrics
+        self.started_at = time.perf_counter()
+        self.last_event_at = self.started_at
+
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+        self.file = open(filepath, 'w')
+
+    def start(self, images_total):
+        """
+        Report the start of the run
+
+        Parameters
+        ----------
+        images_total : int
+            The amount of images of the run
+        """
+        self.images_total = images_total
+        self.started_at = time.perf_counter()
+        self.__write('started')
+
+    def advance(self, num_images, inferred=False):
+        """
+        Report finished images
+
+        Parameters
+        ----------
+        num_images : int
+            The amount of images that are finished
+
+        inferred : optional[bool]
+            If the images went through the model, instead of coming from the cache or checkpoint. Defaults to False.
+        """
+        self.images_done += num_images
+        if inferred:
+            self.images_inferred += num_images
+
+        if time.perf_counter() - self.last_event_at >= self.interval:
+            self.__write('running')
+
+    def finish(self, failed=False):
+        """
+        Report the end of the run, and close the file
+        """
+        self.__write('failed' if failed else 'done')
+        self.file.close()
+
+    def totals(self):
+        """
+        Returns
+        -------
+        totals : dict
+            The finished, total and inferred images, the seconds since the start and the images per second
+        """
+        seconds = time.perf_counter() - self.started_at
+        return {
+            'images_done': self.images_done,
+            'images_total': self.images_total,
+            'images_inferred': self.images_inferred,
+            'seconds': round(seconds, 3),
+            'images_per_second': round(self.images_done / seconds, 2) if seconds > 0 else 0.0
+        }
+
+    def __write(self, state):
+        self.last_event_at = time.perf_counter()
+
+        totals = self.totals()
+        images_left = self.images_total - self.images_done
+        eta_seconds = images_left / totals['images_per_second'] if totals['images_per_second'] > 0 else None
+        if state == 'done':
+            eta_seconds = 0.0
+
+        event = {
+            'state': state,
+            'time': time.time(),
+            **totals,
+            'eta_seconds': round(eta_seconds, 1) if eta_seconds is not None else None,
+            'stages': self.metrics.totals() if self.metrics is not None else {}
+        }
+        # Flushed right away, so the orchestrator sees the event while the run is going
+        self.file.write(json.dumps(event) + '\n')
+        self.file.flush()
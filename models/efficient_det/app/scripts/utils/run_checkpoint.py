@@ -0,0 +1,152 @@
+"""
+This utility module provides checkpoints of an inference run, so an interrupted run can be resumed.
+
+While a run infers, the results of the finished images are written to a checkpoint every
+`interval` images. When the run is started again with `resume`, the images in the checkpoint are not
+inferred again: their detections are taken from the checkpoint, and only the other images are inferred.
+All result files (detection store, COCO files) are written again from the start, so they always contain the whole run.
+
+A checkpoint belongs to a single run, identified by a run key (see `compute_run_key`). It is only resumed
+when the key matches, so a checkpoint of another image folder or model is never used. When the run finishes,
+the checkpoint is removed.
+
+Unlike the result cache, the checkpoint is also used when the result cache is turned off.
+
+Functionality:
+- `RunCheckpoint`:
+    SQLite backed checkpoint. Use `get` to look up a finished image and `put_many` to add finished images.
+
+- `compute_run_key`:
+    Hashes everything that identifies a run into a key.
+
+Note: The same module is used by every model runner. Keep the copies in sync.
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+
+def compute_run_key(model_fingerprint, source, image_dir, image_paths=None):
+    """
+    Computes the key of a run
+
+    Parameters
+    ----------
+    model_fingerprint : str
+        The fingerprint of the model and its settings
+
+    source : str
+        Where the images come from, like the host folder that is mounted
+
+    image_dir : str
+        The folder that is inferred
+
+    image_paths : optional[list]
+        The images that are inferred, when only part of the folder is inferred
+
+    Returns
+    -------
+    run_key : str
+        A hexadecimal hash
+    """
+    run_key = hashlib.sha256()
+    run_key.update(json.dumps([model_fingerprint, source, os.path.normpath(image_dir), image_paths]).encode())
+    return run_key.hexdigest()
+
+class RunCheckpoint:
+    def __init__(self, filepath, run_key, resume=False, interval=256):
+        """
+        Opens the checkpoint
+
+        Parameters
+        ----------
+        filepath : str
+            The path to the SQLite file
+
+        run_key : str
+            The key of the current run, see `compute_run_key`
+
+        resume : optional[bool]
+            Keep the finished images of the checkpoint, when it belongs to the same run.
+            When False, or when the checkpoint belongs to another run, it is started empty. Defaults to False.
+
+        interval : optional[int]
+            The amount of finished images that are collected before they are written to the checkpoint. Defaults to 256.
+        """
+        self.filepath = filepath
+        self.interval = interval
+        self.pending = []
+
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(filepath)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS run (run_key TEXT NOT NULL)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS images (file_path TEXT PRIMARY KEY, result TEXT NOT NULL)')
+
+        row = self.connection.execute('SELECT run_key FROM run').fetchone()
+        if resume and row is not None and row[0] == run_key:
+            self.num_resumed = self.connection.execute('SELECT COUNT(*) FROM images').fetchone()[0]
+        else:
+            if resume and row is not None:
+                print("The checkpoint belongs to another run, starting from the beginning")
+            self.num_resumed = 0
+            self.connection.execute('DELETE FROM run')
+            self.connection.execute('DELETE FROM images')
+            self.connection.execute('INSERT INTO run (run_key) VALUES (?)', (run_key,))
+        self.connection.commit()
+
+    def get(self, file_path):
+        """
+        Look up a finished image
+
+        Parameters
+        ----------
+        file_path : str
+            The path of the image
+
+        Returns
+        -------
+        result : any or None
+            The result of the image, or None when it wasn't finished before
+        """
+        if self.num_resumed == 0:
+            return None
+
+        row = self.connection.execute('SELECT result FROM images WHERE file_path = ?', (os.path.normpath(file_path),)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put_many(self, entries):
+        """
+        Add finished images. They are written once `interval` images are collected.
+
+        Parameters
+        ----------
+        entries : list
+            A list of (file_path, result) tuples. The result must be JSON serializable.
+        """
+        self.pending.extend(entries)
+        if len(self.pending) >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if len(self.pending) == 0:
+            return
+
+        self.connection.executemany('INSERT OR REPLACE INTO images (file_path, result) VALUES (?, ?)',
+                                    [(os.path.normpath(file_path), json.dumps(result)) for file_path, result in self.pending])
+        self.connection.commit()
+        self.pending = []
+
+    def close(self):
+        """
+        Write the remaining images and close the checkpoint, for runs that did not finish
+        """
+        self.flush()
+        self.connection.close()
+
+    def remove(self):
+        """
+        Close and delete the checkpoint, for runs that finished
+        """
+        self.connection.close()
+        os.remove(self.filepath)
@@ -27,6 +27,30 @@ Normalizing:
 - `MEAN`: Sequence of means for each channel
 - `STD`: Sequence of standerd deviations for each channel
 
+Inference:
+- `INFERENCE_BATCH_SIZE`: The default amount of images that are sent to the model at once. Can be overwritten with the `BATCH_SIZE` environment variable.
+- `PREFETCH_WORKERS`: The default amount of workers that decode images ahead of the model. Can be overwritten with the `PREFETCH_WORKERS` environment variable.
+- `PREFETCH_QUEUE_DEPTH`: The default maximum amount of images that are decoded ahead of the model. Can be overwritten with the `PREFETCH_QUEUE_DEPTH` environment variable.
+- `SCORE_THRESHOLD`: Predictions with a lower score are removed before the IoU filter.
+- `IOU_THRESHOLD`: Overlapping predictions with a higher IoU are filtered, so only the one with the highest score stays.
+- `ANNOTATION_SCORE_THRESHOLD`: Predictions with a lower score are not written to the annotations.
+
+Result cache:
+- `RESULT_CACHE_PATH`: The SQLite file with the cached inference results per image. Can be turned off with the `RESULT_CACHE` environment variable.
+
+Results:
+- `DETECTION_STORE_PATH`: The Arrow IPC file with all detections of a run. The COCO annotation files are only written next to it when the `COCO_EXPORT` environment variable is True.
+- `COCO_INDENT`: The indent of the COCO annotation files. None writes them compact, which is smaller and faster for large runs. Can be overwritten with the `COCO_INDENT` environment variable.
+
+Checkpoints:
+- `CHECKPOINT_PATH`: The SQLite file with the finished images of the current run. With the `RESUME` environment variable, an interrupted run continues from it.
+- `CHECKPOINT_INTERVAL`: The default amount of finished images after which the checkpoint is written. Can be overwritten with the `CHECKPOINT_INTERVAL` environment variable.
+
+Progress and metrics:
+- `PROGRESS_PATH`: The JSON lines file the progress events of the current run are written to. The orchestrator follows it while the run is going.
+- `PROGRESS_INTERVAL`: The default minimum amount of seconds between two progress events. Can be overwritten with the `PROGRESS_INTERVAL` environment variable.
+- `METRICS_PATH`: The JSON file with the time per image of every stage of the run (p50, p95, p99) and the images per second, written when the run ends.
+
 Usage:
 - Import this module in other parts of the code where you need to 
   reference class labels or convert between string and integer representations.
@@ -56,4 +80,23 @@ MEAN = [0.485, 0.456, 0.406]
 STD = [0.229, 0.224, 0.225]
 
 APPROPRIATE_FORMATS = ('.png', '.jpg', '.jpeg')
-DATE_TIME_FORMAT = "%m/%d/%Y %H:%M:%S"
\ No newline at end of file
+DATE_TIME_FORMAT = "%m/%d/%Y %H:%M:%S"
+
+INFERENCE_BATCH_SIZE = 8
+PREFETCH_WORKERS = 2
+PREFETCH_QUEUE_DEPTH = 16
+SCORE_THRESHOLD = 0.3
+IOU_THRESHOLD = 0.3
+ANNOTATION_SCORE_THRESHOLD = 0.1
+
+RESULT_CACHE_PATH = "results/.cache/yolo.sqlite"
+
+DETECTION_STORE_PATH = "results/yolo/detections.arrow"
+COCO_INDENT = None
+
+CHECKPOINT_PATH = "results/.checkpoints/yolo.sqlite"
+CHECKPOINT_INTERVAL = 256
+
+PROGRESS_PATH = "results/.progress/yolo.jsonl"
+PROGRESS_INTERVAL = 1.0
+METRICS_PATH = "results/yolo/metrics.json"
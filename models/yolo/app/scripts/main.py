@@ -1,24 +1,120 @@
-import json
 import os
-import copy
+import time
+import sys
+import signal
+import argparse
+from contextlib import nullcontext
 import numpy as np
 
-from PIL import Image
 from .classes.metadata import MetadataProvider
-from .config.constants import ALL_LABELS, APPROPRIATE_FORMATS
+from .config.constants import ALL_LABELS, APPROPRIATE_FORMATS, INFERENCE_BATCH_SIZE, PREFETCH_WORKERS, PREFETCH_QUEUE_DEPTH, \
+    SCORE_THRESHOLD, IOU_THRESHOLD, ANNOTATION_SCORE_THRESHOLD, RESULT_CACHE_PATH, IMAGE_METADATA_HEIGHT, DETECTION_STORE_PATH, COCO_INDENT, \
+    CHECKPOINT_PATH, CHECKPOINT_INTERVAL, PROGRESS_PATH, PROGRESS_INTERVAL, METRICS_PATH
 from .model_yolo import ModelYolo
+from .utils.detection_store import DetectionStoreWriter
+from .utils.coco_writer import CocoWriter
+from .utils.run_checkpoint import RunCheckpoint, compute_run_key
+from .utils.progress_reporter import ProgressReporter
+from .utils.stage_metrics import StageMetrics
+from .utils.image_loading import load_image
+from .utils.image_prefetcher import ImagePrefetcher, iterate_batches
 from .utils.iou_utils import filter_boxes_by_iou
+from .utils.result_cache import ResultCache, compute_model_fingerprint
 from .utils.torch_utils import get_device
 
 model_path = "scripts/model.pt"
 images_path = "test/images/cam1/leging1/"
 result_file = "results/yolo/annotations.json"
+batch_size = int(os.environ.get("BATCH_SIZE", INFERENCE_BATCH_SIZE))
+prefetch_workers = int(os.environ.get("PREFETCH_WORKERS", PREFETCH_WORKERS))
+prefetch_queue_depth = int(os.environ.get("PREFETCH_QUEUE_DEPTH", PREFETCH_QUEUE_DEPTH))
+use_result_cache = os.environ.get("RESULT_CACHE", "True") == "True"
+hash_image_content = os.environ.get("RESULT_CACHE_HASH_CONTENT", "False") == "True"
+# The host folder the images come from, so the cache can tell different image folders apart
+image_source = os.environ.get("IMAGE_SOURCE", "")
+# The detection store is always written, the COCO annotation files only when this is on
+export_coco = os.environ.get("COCO_EXPORT", "True") == "True"
+# Compact by default, set an indent (like 4) for COCO files that are easier to read
+coco_indent = int(os.environ["COCO_INDENT"]) if os.environ.get("COCO_INDENT") else COCO_INDENT
+# Continue an interrupted run from its checkpoint, instead of starting from the beginning
+resume_run = os.environ.get("RESUME", "False") == "True"
+checkpoint_interval = int(os.environ.get("CHECKPOINT_INTERVAL", CHECKPOINT_INTERVAL))
+progress_interval = float(os.environ.get("PROGRESS_INTERVAL", PROGRESS_INTERVAL))
 
 annotations = []
 
-def run():
+def load_model():
     device = get_device()
     model = ModelYolo.create_model(device=device, filepath=model_path)
+    return model, device
+
+def find_image_folders(image_dir='images', image_paths=None):
+    '''
+    Group the images that need inference per folder
+
+    Parameters
+    ----------
+        image_dir: String
+            The folder that is searched (recursively) for images, when no image_paths are given
+        image_paths: list
+            Optional list of image paths. When given, only these images are used
+
+    Returns
+    -------
+        image_folders: dictionary
+            The dictionary key is the folder
+            The dictionary value is a list with the paths of the images in that folder
+    '''
+    image_folders = {}
+    if image_paths is not None:
+        for file_path in image_paths:
+            if f'.{file_path.lower().split(".")[-1]}' in APPROPRIATE_FORMATS:
+                image_folders.setdefault(os.path.dirname(file_path), []).append(file_path)
+        return image_folders
+
+    for root, dirs, files in os.walk(image_dir):
+        file_paths = [os.path.join(root, file) for file in files if f'.{file.lower().split(".")[-1]}' in APPROPRIATE_FORMATS]
+        
+        # Only folders with at least one image are inferred
+        if len(file_paths) > 0:
+            image_folders[root] = file_paths
+
+    return image_folders
+
+def get_model_fingerprint():
+    return compute_model_fingerprint(model_path, {
+        "score_threshold": SCORE_THRESHOLD,
+        "iou_threshold": IOU_THRESHOLD,
+        "annotation_score_threshold": ANNOTATION_SCORE_THRESHOLD,
+        "image_metadata_height": IMAGE_METADATA_HEIGHT
+    })
+
+def open_result_cache(fingerprint):
+    return ResultCache(RESULT_CACHE_PATH, fingerprint, source=image_source, hash_content=hash_image_content)
+
+def open_checkpoint(fingerprint, image_dir, image_paths, resume):
+    checkpoint = RunCheckpoint(CHECKPOINT_PATH, compute_run_key(fingerprint, image_source, image_dir, image_paths), resume=resume, interval=checkpoint_interval)
+    if checkpoint.num_resumed > 0:
+        print(f"Resuming the run, {checkpoint.num_resumed} images were already inferred")
+    return checkpoint
+
+def run(model=None, device=None, image_dir='images', image_paths=None, use_cache=None, coco=None, resume=None):
+    if model is None:
+        model, device = load_model()
+    os.makedirs("./results/yolo", exist_ok=True)
+
+    use_cache = use_result_cache if use_cache is None else use_cache
+    coco = export_coco if coco is None else coco
+    resume = resume_run if resume is None else resume
+    fingerprint = get_model_fingerprint()
+    cache = open_result_cache(fingerprint) if use_cache else None
+    # The finished images are checkpointed, so an interrupted run can be resumed
+    checkpoint = open_checkpoint(fingerprint, image_dir, image_paths, resume)
+    image_folders = find_image_folders(image_dir, image_paths)
+    # The time of every stage is recorded per image, and the orchestrator follows the progress of the run
+    metrics = StageMetrics()
+    progress = ProgressReporter(PROGRESS_PATH, metrics, interval=progress_interval)
+    progress.start(sum(len(file_paths) for file_paths in image_folders.values()))
 
     annotation_object = {
         "licenses":[{"name":"","id":0,"url":""}],
@@ -87,94 +183,184 @@ def run():
         "annotations": []
     }
 
-    main_annotation = annotation_object.copy()
-    annotation_copy = copy.deepcopy(annotation_object)
-
-    for root, dirs, files in os.walk('images'):
-        # Check if there is at least one image file in the current folder
-        has_image = False
-        for file in files:
-            extension = f'.{file.lower().split(".")[-1]}'
-            if extension in APPROPRIATE_FORMATS:
-                has_image = True
-                break
-        
-        if has_image:
-            infer_folder(root, model, device, copy.deepcopy(annotation_copy), main_annotation)
+    # The annotations are streamed to disk: one file for the whole run, and one per folder
+    main_coco = CocoWriter("./results/yolo/annotations.json", annotation_object, indent=coco_indent) if coco else None
+    try:
+        with DetectionStoreWriter(DETECTION_STORE_PATH) as detection_store:
+            for folder, file_paths in image_folders.items():
+                folder_coco = CocoWriter(get_folder_annotation_path(folder), annotation_object, indent=coco_indent) if coco else None
+                with folder_coco if folder_coco is not None else nullcontext():
+                    infer_folder(folder, model, device, folder_coco, main_coco, file_paths=file_paths, cache=cache, detection_store=detection_store, checkpoint=checkpoint, progress=progress, metrics=metrics)
+    except BaseException:
+        progress.finish(failed=True)
+        metrics.write(METRICS_PATH, {'state': 'failed', **progress.totals()})
+        # Keep the checkpoint, so the run can be resumed
+        checkpoint.close()
+        raise
+    finally:
+        if main_coco is not None:
+            main_coco.close()
+
+    checkpoint.remove()
+    progress.finish()
+    metrics.write(METRICS_PATH, {'state': 'done', **progress.totals()})
 
-    with open(("./results/yolo/annotations.json"), "w") as file:
-        json.dump(annotation_object, file, indent=4)
+    if cache is not None:
+        cache.close()
 
 def calculate_area(bbox):
     # bbox is a list or tuple in the format [x, y, width, height]
     _, _, width, height = bbox
     return int(width * height)
 
-def infer_folder(target_folder, model, device, annotation_object, main_annotation):
+def get_folder_annotation_path(target_folder):
     modified_string = target_folder
     modified_string = modified_string.replace("/", "_").replace(" ", "_")
     annotation_name = modified_string + "_annotations.json"
+    return "./results/yolo/"+annotation_name
 
-    
-    for filename in os.listdir(target_folder):
-        if f'.{filename.lower().split(".")[-1]}' in APPROPRIATE_FORMATS:
-            file_path = os.path.join(target_folder, filename)
+def infer_folder(target_folder, model, device, folder_coco, main_coco, file_paths=None, cache=None, detection_store=None, checkpoint=None, progress=None, metrics=None):
+    if file_paths is None:
+        file_paths = [os.path.join(target_folder, filename) for filename in os.listdir(target_folder)
+                      if f'.{filename.lower().split(".")[-1]}' in APPROPRIATE_FORMATS]
+
+    num_images = len(file_paths)
+    lookup_start = time.perf_counter()
+
+    # Images that were inferred before the run was interrupted get their detections from the checkpoint
+    if checkpoint is not None:
+        unfinished_file_paths = []
+        for file_path in file_paths:
+            finished = checkpoint.get(file_path)
+            if finished is None:
+                unfinished_file_paths.append(file_path)
+            else:
+                add_image_annotations(file_path, finished["width"], finished["height"], finished["labels"], finished["boxes"], finished["scores"], folder_coco, main_coco, detection_store)
+
+        if len(unfinished_file_paths) < len(file_paths):
+            print(f"{target_folder}: {len(file_paths) - len(unfinished_file_paths)} from the checkpoint")
+        file_paths = unfinished_file_paths
+
+    # Images that didn't change since the last run get their detections from the cache
+    file_keys = {}
+    if cache is not None:
+        uncached_file_paths = []
+        checkpoint_entries = []
+        for file_path in file_paths:
+            file_key, cached = cache.get(file_path)
+            if cached is None:
+                file_keys[file_path] = file_key
+                uncached_file_paths.append(file_path)
+            else:
+                add_image_annotations(file_path, cached["width"], cached["height"], cached["labels"], cached["boxes"], cached["scores"], folder_coco, main_coco, detection_store)
+                checkpoint_entries.append((file_path, cached))
+        
+        print(f"{target_folder}: {len(file_paths) - len(uncached_file_paths)} cached, {len(uncached_file_paths)} to infer")
+        file_paths = uncached_file_paths
+        if checkpoint is not None:
+            checkpoint.put_many(checkpoint_entries)
+
+    if metrics is not None:
+        metrics.record('lookup', time.perf_counter() - lookup_start, num_images)
+    if progress is not None:
+        progress.advance(num_images - len(file_paths))
+
+    # Decode the next images in the background while the model works on the current batch
+    prefetcher = ImagePrefetcher(file_paths, load_image, num_workers=prefetch_workers, queue_depth=prefetch_queue_depth)
+
+    # Stream the folder through the model in fixed-size batches
+    batch_requested = time.perf_counter()
+    for batch in iterate_batches(prefetcher, batch_size):
+        batch_received = time.perf_counter()
+        for file_path, _ in batch:
             print(file_path)
-            
-            image = Image.open(file_path)
-            annotation_object["images"].append({"id":(len(annotation_object["images"])+1),"width":image.width,"height":image.height,"file_name":filename,"license":0,"flickr_url":"","coco_url":"","date_captured":0})
-            main_annotation["images"].append({"id":(len(main_annotation["images"])+1),"width":image.width,"height":image.height,"file_name":os.path.join(*(file_path.split(os.path.sep)[1:])),"license":0,"flickr_url":"","coco_url":"","date_captured":0})
 
-            labels, boxes, scores = inference(image, model)
-            
-            score_threshold = 0.1
-            filtered_boxes, filtered_labels, filtered_scores = [], [], []
-            
-            for i in range(len(scores)):
-                if scores[i] >= score_threshold:
-                    filtered_boxes.append(boxes[i])
-                    filtered_labels.append(labels[i])
-                    filtered_scores.append(scores[i])
-            
-            for i in range(len(filtered_boxes)):
-                animal_name = ALL_LABELS[labels[i]]
-                if animal_name in ALL_LABELS:
-                    animal_index = ALL_LABELS.index(animal_name)
-                else:
-                    continue
-                annotation_object["annotations"].append({
-                    "id":(len(annotation_object["annotations"])+1),
-                    "image_id":len(annotation_object["images"]),
-                    "category_id":animal_index,
-                    "segmentation":[],
-                    "area": float(calculate_area(filtered_boxes[i])),
-                    "bbox": [float(x) for x in filtered_boxes[i]],
-                    "iscrowd":0,
-                    "attributes":{"occluded":False,"rotation":0.0}, 
-                    "score": float(filtered_scores[i])
-                    }) 
-                main_annotation["annotations"].append({
-                    "id":(len(main_annotation["annotations"])+1),
-                    "image_id":len(main_annotation["images"]),
-                    "category_id":animal_index,
-                    "segmentation":[],
-                    "area": float(calculate_area(filtered_boxes[i])),
-                    "bbox": [float(x) for x in filtered_boxes[i]],
-                    "iscrowd":0,
-                    "attributes":{"occluded":False,"rotation":0.0}, 
-                    "score": float(filtered_scores[i])
-                    }) 
-    with open(("./results/yolo/"+annotation_name), "w") as file:
-        json.dump(annotation_object, file, indent=4)   
+        images_main = [image_main for _, (image_main, _, _, _) in batch]
+        batch_results = inference_batch(images_main, model, metrics)
+        batch_inferred = time.perf_counter()
 
-def inference(image, model):
-    mdp = MetadataProvider()
+        finished_entries = []
+        cache_entries = []
+        for (file_path, (_, width, height, _)), (labels, boxes, scores) in zip(batch, batch_results):
+            add_image_annotations(file_path, width, height, labels, boxes, scores, folder_coco, main_coco, detection_store)
+            result = {
+                "width": width,
+                "height": height,
+                "labels": [int(label) for label in labels],
+                "boxes": [[float(x) for x in box] for box in boxes],
+                "scores": [float(score) for score in scores]
+            }
+            finished_entries.append((file_path, result))
+            if cache is not None:
+                cache_entries.append((file_keys[file_path], result))
+        
+        if cache is not None:
+            cache.put_many(cache_entries)
+        if checkpoint is not None:
+            checkpoint.put_many(finished_entries)
 
-    image_main, x = mdp.split_image_and_metadata(image)
-    boxes, labels, scores = ModelYolo.infer_on_image(model, image_main)
+        batch_written = time.perf_counter()
+        if metrics is not None:
+            # Decoding and preprocessing ran in the prefetcher, the wait is the time the model was idle
+            for _, (_, _, _, timings) in batch:
+                for stage, seconds in timings.items():
+                    metrics.record(stage, seconds)
+            metrics.record('prefetch_wait', batch_received - batch_requested, len(batch))
+            metrics.record('write', batch_written - batch_inferred, len(batch))
+        if progress is not None:
+            progress.advance(len(batch), inferred=True)
+        batch_requested = time.perf_counter()
+
+def add_image_annotations(file_path, width, height, labels, boxes, scores, folder_coco, main_coco, detection_store=None):
+    relative_path = os.path.join(*(file_path.split(os.path.sep)[1:]))
+
+    score_threshold = ANNOTATION_SCORE_THRESHOLD
+    filtered_boxes, filtered_labels, filtered_scores = [], [], []
+    
+    for i in range(len(scores)):
+        if scores[i] >= score_threshold:
+            filtered_boxes.append(boxes[i])
+            filtered_labels.append(labels[i])
+            filtered_scores.append(scores[i])
+    
+    # A (category_id, category, bbox, score) tuple per detection
+    detections, areas = [], []
+    for i in range(len(filtered_boxes)):
+        animal_name = ALL_LABELS[filtered_labels[i]]
+        if animal_name in ALL_LABELS:
+            animal_index = ALL_LABELS.index(animal_name)
+        else:
+            continue
+        detections.append((animal_index, animal_name, [float(x) for x in filtered_boxes[i]], float(filtered_scores[i])))
+        areas.append(float(calculate_area(filtered_boxes[i])))
+
+    if detection_store is not None:
+        detection_store.add_image(relative_path, width, height, detections)
+
+    # The COCO export is optional
+    if folder_coco is None:
+        return
 
+    filename = os.path.basename(file_path)
+    folder_image_id = folder_coco.add_image({"width":width,"height":height,"file_name":filename,"license":0,"flickr_url":"","coco_url":"","date_captured":0})
+    main_image_id = main_coco.add_image({"width":width,"height":height,"file_name":relative_path,"license":0,"flickr_url":"","coco_url":"","date_captured":0})
+
+    for (animal_index, _, bbox, score), area in zip(detections, areas):
+        annotation = {
+            "category_id":animal_index,
+            "segmentation":[],
+            "area": area,
+            "bbox": bbox,
+            "iscrowd":0,
+            "attributes":{"occluded":False,"rotation":0.0}, 
+            "score": score
+            }
+        folder_coco.add_annotation(folder_image_id, annotation)
+        main_coco.add_annotation(main_image_id, annotation)
+
+def filter_predictions(boxes, labels, scores):
     # Filter results
-    score_threshold = 0.3
+    score_threshold = SCORE_THRESHOLD
     filtered_boxes, filtered_labels, filtered_scores = [], [], []
             
     for i in range(len(scores)):
@@ -183,10 +369,46 @@ def inference(image, model):
             filtered_labels.append(labels[i])
             filtered_scores.append(scores[i])   
             
-    filtered_labels, filtered_boxes, filtered_scores = filter_boxes_by_iou(filtered_labels, filtered_boxes, filtered_scores, iou_threshold=0.3)
+    filtered_labels, filtered_boxes, filtered_scores = filter_boxes_by_iou(filtered_labels, filtered_boxes, filtered_scores, iou_threshold=IOU_THRESHOLD)
 
     return filtered_labels, filtered_boxes, filtered_scores
 
+def inference(image, model):
+    mdp = MetadataProvider()
+
+    image_main, x = mdp.split_image_and_metadata(image)
+    boxes, labels, scores = ModelYolo.infer_on_image(model, image_main)
+
+    return filter_predictions(boxes, labels, scores)
+
+def inference_batch(images_main, model, metrics=None):
+    '''
+    Run the model on a list of images at once
+
+    Parameters
+    ----------
+        images_main: list
+            The images to infer, as numpy arrays without the metadata strip
+        model: YOLO
+            The loaded YOLO model
+        metrics: StageMetrics
+            Records the `forward` and `nms` (the IoU filter) stages. Optional
+
+    Returns
+    -------
+        results: list
+            A (labels, boxes, scores) tuple per image, in the same order as `images_main`
+    '''
+    forward_start = time.perf_counter()
+    predictions = ModelYolo.infer_on_batch(model, images_main, batch_size=batch_size)
+    nms_start = time.perf_counter()
+    results = [filter_predictions(boxes, labels, scores) for boxes, labels, scores in predictions]
+
+    if metrics is not None:
+        metrics.record('forward', nms_start - forward_start, len(images_main))
+        metrics.record('nms', time.perf_counter() - nms_start, len(images_main))
+    return results
+
 # def put_results_into_file(images, annotations, classes):
 #      # Create file
 #      # Name per file "[camera]_[leging]_annotation"
@@ -245,4 +467,11 @@ def inference(image, model):
 #     rf.close()
 
 # Run the program
-run()
\ No newline at end of file
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted run from its checkpoint')
+    args = parser.parse_args()
+
+    # docker stop sends SIGTERM, exit like an interrupt so the checkpoint is written
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+    run(resume=args.resume or None)
\ No newline at end of file
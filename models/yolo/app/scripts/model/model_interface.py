@@ -5,6 +5,9 @@ class ModelInterface():
     def infer_on_image(model, image, device):
         pass
 
+    def infer_on_batch(model, images, batch_size):
+        pass
+
     def evauate(model):
         pass
 
@@ -49,6 +49,39 @@ class ModelYolo(ModelInterface):
 
         return boxes, labels, scores
     
+    def infer_on_batch(model, images, batch_size=8):
+        """
+        Perform inference on multiple images using the YOLO11 model.
+        The images are sent to the model in chunks of `batch_size`, so the model sees a full batch per forward pass.
+
+        Parameters
+        ----------
+        model : The trained YOLO11 model
+        
+        images : A list of images as numpy arrays
+        
+        batch_size : The amount of images that are sent to the model at once
+        
+        Returns
+        -------
+        predictions : A list with a (boxes, labels, scores) tuple per image, in the same order as `images`
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size should be at least 1, but got {batch_size}")
+
+        predictions = []
+        for batch_start in range(0, len(images), batch_size):
+            batch = [cv2.cvtColor(image, cv2.COLOR_BGR2RGB) for image in images[batch_start:batch_start + batch_size]]
+
+            results = model(batch)
+            for result in results:
+                boxes = result.boxes.xyxy.cpu().numpy()
+                scores = result.boxes.conf.cpu().numpy()
+                labels = result.boxes.cls.cpu().numpy().astype(int)
+                predictions.append((boxes, labels, scores))
+
+        return predictions
+    
     def evauate(model):
         """
         Evaluate the model on the validation dataset.
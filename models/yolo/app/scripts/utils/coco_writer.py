@@ -0,0 +1,145 @@
+"""
+This utility module provides a COCO annotation file writer that streams the records to disk.
+
+Building the whole annotation file as a dictionary and dumping it at the end keeps every image and
+annotation of the run in memory, and loses all of them when the run crashes. `CocoWriter` writes
+every image and annotation record to disk as soon as it is added, so memory stays bounded.
+
+The images and annotations are appended to two part files next to the annotation file. When the writer
+is closed, the parts are copied into the annotation file (in the normal COCO layout), and removed.
+When the run fails, the writer is still closed, so the annotation file has everything up to the error.
+
+By default the file is written compact, without whitespace. With an indent, the file is exactly
+what `json.dump(annotation_object, file, indent=indent)` would write.
+
+Functionality:
+- `CocoWriter`:
+    Use `add_image` and `add_annotation` to write the records, and `close` (or a `with` block) to finish the file.
+
+Note: The same module is used by every model runner. Keep the copies in sync.
+"""
+
+import os
+import json
+import shutil
+
+class CocoWriter:
+    def __init__(self, filepath, template, indent=None):
+        """
+        Starts a new annotation file
+
+        Parameters
+        ----------
+        filepath : str
+            The path of the annotation file
+
+        template : dict
+            The annotation object. Every key except `images` and `annotations` (like `licenses`,
+            `info` and `categories`) is written to the file as is, in the same order.
+
+        indent : optional[int]
+            The indent of the file, like `json.dump`. Defaults to None, which writes the file compact.
+        """
+        self.filepath = filepath
+        self.template = {key: value for key, value in template.items() if key not in ('images', 'annotations')}
+        self.indent = indent
+        self.num_images = 0
+        self.num_annotations = 0
+
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+        self.images_file = open(filepath + '.images.tmp', 'w')
+        self.annotations_file = open(filepath + '.annotations.tmp', 'w')
+
+    def __dumps(self, value, level):
+        if self.indent is None:
+            return json.dumps(value, separators=(',', ':'))
+
+        # Indent the value like it is nested `level` deep in the file
+        return json.dumps(value, indent=self.indent).replace('\n', '\n' + ' ' * (self.indent * level))
+
+    def __write_record(self, file, count, record):
+        if self.indent is None:
+            file.write((',' if count > 0 else '') + self.__dumps(record, 2))
+        else:
+            file.write((',\n' if count > 0 else '') + ' ' * (self.indent * 2) + self.__dumps(record, 2))
+
+    def add_image(self, record):
+        """
+        Write an image record
+
+        Parameters
+        ----------
+        record : dict
+            The image record, without id
+
+        Returns
+        -------
+        image_id : int
+            The id the image got
+        """
+        self.num_images += 1
+        self.__write_record(self.images_file, self.num_images - 1, {'id': self.num_images, **record})
+        return self.num_images
+
+    def add_annotation(self, image_id, record):
+        """
+        Write an annotation record
+
+        Parameters
+        ----------
+        image_id : int
+            The id of the image, as returned by `add_image`
+
+        record : dict
+            The annotation record, without id and image_id
+
+        Returns
+        -------
+        annotation_id : int
+            The id the annotation got
+        """
+        self.num_annotations += 1
+        self.__write_record(self.annotations_file, self.num_annotations - 1, {'id': self.num_annotations, 'image_id': image_id, **record})
+        return self.num_annotations
+
+    def __write_list(self, file, key, part_file, count):
+        part_file.close()
+        if self.indent is None:
+            file.write(f'{json.dumps(key)}:[')
+        else:
+            file.write(' ' * self.indent + f'{json.dumps(key)}: [' + ('\n' if count > 0 else ''))
+
+        with open(part_file.name, 'r') as part:
+            shutil.copyfileobj(part, file)
+        os.remove(part_file.name)
+
+        if self.indent is not None and count > 0:
+            file.write('\n' + ' ' * self.indent)
+        file.write(']')
+
+    def close(self):
+        """
+        Finish the annotation file
+        """
+        newline = '' if self.indent is None else '\n'
+        separator = ',' + newline
+
+        with open(self.filepath, 'w') as file:
+            file.write('{' + newline)
+            for key, value in self.template.items():
+                if self.indent is None:
+                    file.write(f'{json.dumps(key)}:{self.__dumps(value, 1)}{separator}')
+                else:
+                    file.write(' ' * self.indent + f'{json.dumps(key)}: {self.__dumps(value, 1)}{separator}')
+
+            self.__write_list(file, 'images', self.images_file, self.num_images)
+            file.write(separator)
+            self.__write_list(file, 'annotations', self.annotations_file, self.num_annotations)
+            file.write(newline + '}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, exception_traceback):
+        # Also when the run failed, so everything that was inferred before the error is kept
+        self.close()
@@ -0,0 +1,47 @@
+"""
+This utility module contains the function that the image prefetcher uses to load images for the YOLO model.
+
+It lives in its own module (instead of `main.py`) so it can be pickled and used by a process pool.
+"""
+
+import time
+import numpy as np
+from PIL import Image
+from ..classes.metadata import MetadataProvider
+
+def load_image(file_path):
+    """
+    Decodes an image and crops off the metadata strip at the bottom.
+
+    Parameters
+    ----------
+    file_path : str
+        The path of the image
+
+    Returns
+    -------
+    image_main : np.ndarray
+        The image without the metadata portion at the bottom (RGB)
+
+    width : int
+        The width of the original image
+
+    height : int
+        The height of the original image
+
+    timings : dict
+        The seconds the `decode` and `preprocess` stages took. They are returned instead of recorded,
+        so they also reach the run when the image is loaded in another process.
+    """
+    decode_start = time.perf_counter()
+    with Image.open(file_path) as image:
+        width, height = image.width, image.height
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image = np.array(image)
+
+    preprocess_start = time.perf_counter()
+    image_main, _ = MetadataProvider().split_image_and_metadata(image)
+    preprocess_end = time.perf_counter()
+
+    return image_main, width, height, {'decode': preprocess_start - decode_start, 'preprocess': preprocess_end - preprocess_start}
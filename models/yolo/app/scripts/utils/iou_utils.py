@@ -9,13 +9,26 @@ Functionality:
 - `is_fully_covered`: 
     Determines if one bounding box is fully covered by another, either in a contained or containing relationship.
 
+- `compute_overlap_matrix`:
+    Computes, for every pair of bounding boxes at once, if they overlap more than the IoU threshold or if one fully covers the other.
+
 - `filter_boxes_by_iou`: 
     Filters overlapping bounding boxes based on IoU and confidence scores, keeping the box with the higher score. 
     It also checks for full coverage and suppresses boxes accordingly.
+    The pairwise checks are done with NumPy, only the suppression walk itself loops over the boxes.
+
+- `filter_boxes_by_iou_batched`:
+    Applies `filter_boxes_by_iou` to the predictions of many images at once.
+
+- `filter_boxes_by_iou_loop`:
+    The original pure Python implementation of `filter_boxes_by_iou`. Kept as reference for equivalence checks and benchmarks.
 """
 
 import numpy as np
 
+# Below this amount of boxes the NumPy overhead is bigger than the pairwise loop itself
+VECTORIZE_MIN_BOXES = 8
+
 def compute_iou(box1, box2):
     x_min1, y_min1, x_max1, y_max1 = box1
     x_min2, y_min2, x_max2, y_max2 = box2
@@ -43,7 +56,107 @@ def is_fully_covered(box1, box2):
 
     return (x_min1 >= x_min2 and y_min1 >= y_min2 and x_max1 <= x_max2 and y_max1 <= y_max2) or (x_min1 <= x_min2 and y_min1 <= y_min2 and x_max1 >= x_max2 and y_max1 >= y_max2)
 
+def compute_overlap_matrix(boxes, iou_threshold=0.3):
+    """
+    Computes which pairs of boxes overlap, with the same rules as `compute_iou` and `is_fully_covered`.
+
+    Parameters
+    ----------
+    boxes : np.ndarray
+        An (n, 4) array with boxes in the [x_min, y_min, x_max, y_max] format
+
+    iou_threshold : float
+        Pairs with an IoU above this threshold overlap
+
+    Returns
+    -------
+    overlap : np.ndarray
+        An (n, n) boolean array, True where the IoU of the pair is above the threshold or one box fully covers the other
+    """
+    x_min, y_min, x_max, y_max = (boxes[:, i] for i in range(4))
+
+    inter_width = np.maximum(0, np.minimum(x_max[:, None], x_max[None, :]) - np.maximum(x_min[:, None], x_min[None, :]))
+    inter_height = np.maximum(0, np.minimum(y_max[:, None], y_max[None, :]) - np.maximum(y_min[:, None], y_min[None, :]))
+    inter_area = inter_width * inter_height
+
+    area = (x_max - x_min) * (y_max - y_min)
+    union_area = area[:, None] + area[None, :] - inter_area
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        iou = np.where(union_area != 0, inter_area / union_area, 0)
+
+    # Box i inside box j, or box j inside box i
+    inside = (x_min[:, None] >= x_min[None, :]) & (y_min[:, None] >= y_min[None, :]) & (x_max[:, None] <= x_max[None, :]) & (y_max[:, None] <= y_max[None, :])
+    covered = inside | inside.T
+
+    return (iou > iou_threshold) | covered
+
 def filter_boxes_by_iou(labels, boxes, scores, iou_threshold=0.3):
+    num_boxes = len(boxes)
+    if num_boxes < VECTORIZE_MIN_BOXES:
+        return filter_boxes_by_iou_loop(labels, boxes, scores, iou_threshold=iou_threshold)
+
+    box_array = np.asarray(boxes).reshape(num_boxes, 4)
+    if not np.issubdtype(box_array.dtype, np.floating):
+        box_array = box_array.astype(np.float64)
+    score_array = np.asarray(scores)
+    overlap = compute_overlap_matrix(box_array, iou_threshold)
+
+    # Same walk as filter_boxes_by_iou_loop, but each row of comparisons is done at once:
+    # box i suppresses every overlapping box after it, until it meets one with a higher score.
+    # Then box i itself is suppressed and the boxes after that one are left untouched.
+    suppressed = np.zeros(num_boxes, dtype=bool)
+    for i in range(num_boxes):
+        if suppressed[i]:
+            continue
+
+        candidates = np.flatnonzero(overlap[i, i + 1:] & ~suppressed[i + 1:]) + i + 1
+        if len(candidates) == 0:
+            continue
+
+        loses = score_array[candidates] > score_array[i]
+        if loses.any():
+            first_loss = int(np.argmax(loses))
+            suppressed[candidates[:first_loss]] = True
+            suppressed[i] = True
+        else:
+            suppressed[candidates] = True
+
+    keep_indices = np.flatnonzero(~suppressed)
+
+    filtered_labels = [labels[i] for i in keep_indices]
+    filtered_boxes = [boxes[i] for i in keep_indices]
+    filtered_scores = [scores[i] for i in keep_indices]
+
+    return filtered_labels, filtered_boxes, filtered_scores
+
+def filter_boxes_by_iou_batched(labels_list, boxes_list, scores_list, iou_threshold=0.3):
+    """
+    Filters the predictions of multiple images. Boxes of different images are never compared with each other.
+
+    Parameters
+    ----------
+    labels_list : list
+        A list with the labels per image
+    
+    boxes_list : list
+        A list with the boxes per image
+
+    scores_list : list
+        A list with the scores per image
+
+    iou_threshold : float
+        Pairs with an IoU above this threshold overlap
+
+    Returns
+    -------
+    results : list
+        A (labels, boxes, scores) tuple per image, in the same order as the input
+    """
+    return [filter_boxes_by_iou(labels, boxes, scores, iou_threshold=iou_threshold)
+            for labels, boxes, scores in zip(labels_list, boxes_list, scores_list)]
+
+def filter_boxes_by_iou_loop(labels, boxes, scores, iou_threshold=0.3):
     keep_indices = []  
     num_boxes = len(boxes)
 
@@ -0,0 +1,137 @@
+"""
+This utility module provides a persistent cache with the inference results per image.
+
+Camera folders mostly only gain new images between runs. With the cache, a re-run only infers
+the images that are new or changed, and takes the detections of the other images from the cache.
+
+An entry is only used when both of these match:
+- The file key: the path, size and modification time of the image (or a hash of its content, when `hash_content` is True).
+- The model fingerprint: a hash of the model weights and the settings that change the detections (like the thresholds).
+  Entries of other fingerprints are removed when the cache is opened, so the cache doesn't keep growing.
+
+Functionality:
+- `ResultCache`:
+    SQLite backed cache. Use `get` to look up the result of an image and `put_many` to store new results.
+
+- `compute_model_fingerprint`:
+    Hashes the weights file and settings into a fingerprint.
+
+Note: The same module is used by every model runner. Keep the copies in sync.
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def hash_file(file_path):
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+def compute_model_fingerprint(weights_path, settings):
+    """
+    Computes a fingerprint for the model and the settings that influence its results.
+
+    Parameters
+    ----------
+    weights_path : str
+        The path to the model weights
+
+    settings : dict
+        JSON serializable settings that change the detections, like thresholds
+
+    Returns
+    -------
+    fingerprint : str
+        A hexadecimal hash
+    """
+    fingerprint = hashlib.sha256()
+    fingerprint.update(hash_file(weights_path).encode())
+    fingerprint.update(json.dumps(settings, sort_keys=True).encode())
+    return fingerprint.hexdigest()
+
+class ResultCache:
+    def __init__(self, filepath, model_fingerprint, source='', hash_content=False):
+        """
+        Opens (or creates) the cache
+
+        Parameters
+        ----------
+        filepath : str
+            The path to the SQLite file
+
+        model_fingerprint : str
+            The fingerprint of the current model, see `compute_model_fingerprint`
+
+        source : optional[str]
+            Identifies where the images come from (like the host folder that is mounted), so images with
+            the same relative path from different folders don't share entries. Defaults to ''.
+
+        hash_content : optional[bool]
+            Use a hash of the file content as key instead of the path, size and modification time.
+            Slower, because every image is read one extra time, but also detects changes that keep the size and time. Defaults to False.
+        """
+        self.model_fingerprint = model_fingerprint
+        self.source = source
+        self.hash_content = hash_content
+
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(filepath)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results (file_key TEXT NOT NULL, model_fingerprint TEXT NOT NULL, result TEXT NOT NULL, PRIMARY KEY (file_key, model_fingerprint))')
+        self.connection.execute('DELETE FROM results WHERE model_fingerprint != ?', (model_fingerprint,))
+        self.connection.commit()
+
+    def file_key(self, file_path):
+        """
+        Returns
+        -------
+        file_key : str
+            The key of the image in the cache
+        """
+        if self.hash_content:
+            return f'{self.source}|{hash_file(file_path)}'
+
+        stat = os.stat(file_path)
+        return f'{self.source}|{os.path.normpath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}'
+
+    def get(self, file_path):
+        """
+        Look up the result of an image
+
+        Parameters
+        ----------
+        file_path : str
+            The path of the image
+
+        Returns
+        -------
+        file_key : str
+            The key of the image, pass it to `put_many` when the image has to be inferred
+
+        result : any or None
+            The cached result, or None when the image isn't in the cache
+        """
+        file_key = self.file_key(file_path)
+        row = self.connection.execute('SELECT result FROM results WHERE file_key = ? AND model_fingerprint = ?', (file_key, self.model_fingerprint)).fetchone()
+        return file_key, (json.loads(row[0]) if row is not None else None)
+
+    def put_many(self, entries):
+        """
+        Store results in the cache
+
+        Parameters
+        ----------
+        entries : list
+            A list of (file_key, result) tuples. The result must be JSON serializable.
+        """
+        self.connection.executemany('INSERT OR REPLACE INTO results (file_key, model_fingerprint, result) VALUES (?, ?, ?)',
+                                    [(file_key, self.model_fingerprint, json.dumps(result)) for file_key, result in entries])
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,155 @@
+"""
+This utility module records how long every stage of a run takes, per image, as histograms.
+
+A stage is a step that every image goes through, like decoding, the model forward pass or writing the
+results. The time of a batched stage is spread evenly over the images of the batch. The times are counted
+in buckets that grow by `BUCKET_GROWTH` (5%), so a histogram has a fixed size, no matter how many images
+a run has, and the percentiles are accurate to about 5%.
+
+The summary of every stage has its `count` (images), `total_seconds`, `mean_seconds`, `p50_seconds`,
+`p95_seconds`, `p99_seconds`, `max_seconds` and `images_per_second` (the images the stage handles per
+second on its own, which shows the bottleneck of the run).
+
+Functionality:
+- `StageMetrics`:
+    Use `record` (or a `measure` block) to add the time of a stage, `totals` for the total time per
+    stage and `write` to write the summary of all stages to a JSON file.
+
+Note: The same module is used by every model runner, the postprocessing and the GUI. Keep the copies in sync.
+"""
+
+import os
+import json
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+MIN_SECONDS = 1e-6 # Faster images are counted in the first bucket
+BUCKET_GROWTH = 1.05
+NUM_BUCKETS = 500 # The last bucket starts at about 10 hours
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def add(self, seconds, count=1):
+        if seconds <= MIN_SECONDS:
+            bucket = 0
+        else:
+            bucket = min(int(math.log(seconds / MIN_SECONDS) / math.log(BUCKET_GROWTH)) + 1, NUM_BUCKETS - 1)
+
+        self.counts[bucket] += count
+        self.count += count
+        self.total_seconds += seconds * count
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def percentile(self, fraction):
+        """
+        Returns
+        -------
+        seconds : float
+            The upper bound of the bucket the percentile falls in, or 0.0 when the histogram is empty
+        """
+        if self.count == 0:
+            return 0.0
+
+        target = max(math.ceil(fraction * self.count), 1)
+        cumulative = 0
+        for bucket, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return min(MIN_SECONDS * BUCKET_GROWTH ** bucket, self.max_seconds)
+        return self.max_seconds
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total_seconds': round(self.total_seconds, 6),
+            'mean_seconds': round(self.total_seconds / self.count, 6) if self.count > 0 else 0.0,
+            'p50_seconds': round(self.percentile(0.50), 6),
+            'p95_seconds': round(self.percentile(0.95), 6),
+            'p99_seconds': round(self.percentile(0.99), 6),
+            'max_seconds': round(self.max_seconds, 6),
+            'images_per_second': round(self.count / self.total_seconds, 2) if self.total_seconds > 0 else None
+        }
+
+class StageMetrics:
+    def __init__(self):
+        self.histograms = {}
+        # The stages can be recorded from several threads, like the image prefetcher
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds, num_images=1):
+        """
+        Add the time of a stage
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage
+
+        seconds : float
+            The time the stage took
+
+        num_images : optional[int]
+            The amount of images the stage handled in this time, for a batched stage. Defaults to 1.
+        """
+        if num_images < 1:
+            return
+
+        with self.lock:
+            histogram = self.histograms.setdefault(stage, Histogram())
+            histogram.add(seconds / num_images, count=num_images)
+
+    @contextmanager
+    def measure(self, stage, num_images=1):
+        """
+        Record the time of the block as a stage, see `record`
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, num_images)
+
+    def totals(self):
+        """
+        Returns
+        -------
+        totals : dict
+            The total seconds per stage
+        """
+        with self.lock:
+            return {stage: round(histogram.total_seconds, 3) for stage, histogram in self.histograms.items()}
+
+    def summary(self):
+        """
+        Returns
+        -------
+        summary : dict
+            The summary per stage, see the module description
+        """
+        with self.lock:
+            return {stage: histogram.summary() for stage, histogram in self.histograms.items()}
+
+    def write(self, filepath, run=None):
+        """
+        Write the summary of all stages to a JSON file
+
+        Parameters
+        ----------
+        filepath : str
+            The path of the JSON file
+
+        run : optional[dict]
+            The totals of the whole run, like the amount of images and the images per second
+        """
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+        temporary_filepath = filepath + '.tmp'
+        with open(temporary_filepath, 'w') as file:
+            json.dump({'run': run or {}, 'stages': self.summary()}, file, indent=4)
+        os.replace(temporary_filepath, filepath)
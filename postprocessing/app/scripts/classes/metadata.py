@@ -27,6 +27,13 @@ Usage Example:
 4. To extract metadata from an image:
    date, time, camera = metadata_p.extract_metadata(image)
 
+   Or, without decoding the whole image into memory:
+   date, time, camera = metadata_p.extract_metadata(metadata_p.load_metadata_strip('./scripts/publicpreview.jpg'))
+
+   When the provider is created with `ocr_cache_path`, the text of every metadata strip is cached,
+   so the same strip is never read by tesseract twice:
+   metadata_p = MetadataProvider(mode="inference", ocr_cache_path='results/.cache/ocr.sqlite')
+
 5. To retrieve the DataFrame of metadata:
    df = metadata_p.get_df()
 
@@ -39,14 +46,16 @@ import pandas as pd
 import numpy as np
 import pytesseract
 import re
-from ..config.constants import IMAGE_METADATA_HEIGHT
+from PIL import Image
+from ..config.constants import IMAGE_METADATA_HEIGHT, TESSERACT_CONFIG
 from ..config.settings import pytesseract_executable_path
+from ..utils.ocr_cache import OcrCache
 
 # !IMPORTANT For Installing pytesseract refer to config/settings.py
 pytesseract.pytesseract.tesseract_cmd = pytesseract_executable_path
 
 class MetadataProvider:
-    def __init__(self, filepath: str = None, overwrite: bool = True, mode: str = "preprocessing") -> None:
+    def __init__(self, filepath: str = None, overwrite: bool = True, mode: str = "preprocessing", ocr_cache_path: str = None) -> None:
         """
         Initializes the metadata provider utility class
 
@@ -61,10 +70,18 @@ class MetadataProvider:
         mode : optional[str]
             Mode of operation - "preprocessing" to manage metadata file, or "inference" to only perform metadata extraction. 
             Defaults to "preprocessing".
+
+        ocr_cache_path : optional[str]
+            Path to the SQLite file that caches the text tesseract reads per metadata strip.
+            When None, every strip is read by tesseract. Defaults to None.
         """
         
         self.filepath = filepath
         self.mode = mode
+        self.ocr_cache = None
+        if ocr_cache_path is not None:
+            tesseract_version = str(pytesseract.get_tesseract_version())
+            self.ocr_cache = OcrCache(ocr_cache_path, f'{tesseract_version}|{TESSERACT_CONFIG}')
         
         # Initialize the DataFrame and handle file creation in preprocessing mode
         if self.mode == "preprocessing":
@@ -137,7 +154,10 @@ class MetadataProvider:
             image_cropped = image[start_y:height, 0:width, :] 
 
         # Use pytesseract to extract text from the bottom area, all detected text is saved
-        text = pytesseract.image_to_string(image_cropped, config='--psm 11')
+        if self.ocr_cache is not None:
+            text = self.ocr_cache.get_or_read(image_cropped, self.__read_text)
+        else:
+            text = self.__read_text(image_cropped)
         single_line_text = ' '.join(text.split('\n'))
         lines = single_line_text.split(' ')  # Split text into an array of lines
         lines = [re.sub(r"[^a-zA-Z0-9:/]","", line) for line in lines]
@@ -193,6 +213,43 @@ class MetadataProvider:
 
         return date, time, camera
 
+    def load_metadata_strip(self, image_path: str):
+        """
+        Loads only the metadata portion at the bottom of an image file, without keeping the rest of the image in memory.
+
+        JPEG files are decoded in grayscale (only the luminance channel, at full resolution), which skips the
+        chroma decoding and color conversion. The entropy coded rows above the strip can't be skipped by the decoder,
+        but they are decoded into a single channel buffer that is released right after cropping, and the main
+        image is never converted to a numpy array.
+
+        Parameters
+        ----------
+        image_path : str
+            The path of the image
+
+        Returns
+        -------
+        image_metadata : np.ndarray
+            The cropped metadata portion from the bottom of the image.
+        """
+        with Image.open(image_path) as image:
+            width, height = image.size
+
+            start_y = height - IMAGE_METADATA_HEIGHT
+            if start_y < 0:
+                raise ValueError(f"IMAGE_METADATA_HEIGHT of {IMAGE_METADATA_HEIGHT} is larger than the image height.")
+
+            if image.format == 'JPEG':
+                # Luminance only, at full scale, so the text is as sharp as in the original
+                image.draft('L', (width, height))
+
+            image_metadata = image.crop((0, start_y, width, height))
+
+        return np.array(image_metadata)
+
+    def __read_text(self, image: np.ndarray):
+        return pytesseract.image_to_string(image, config=TESSERACT_CONFIG)
+
     def split_image_and_metadata(self, image: np.ndarray):
         """
         Splits an image into two parts: the main content (without metadata) and the metadata section.
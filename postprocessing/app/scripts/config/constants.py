@@ -2,12 +2,30 @@
 This module defines constants used in various parts of the postprocess part of the project
 
 - `IMAGE_METADAT_HEIGHT`: Used to define the height of the metadata part of the images.
+- `ALL_LABELS`: The names of all labels the models can predict.
 - `APPROPRIATE_FORMATS`: Definition of all accepted images file formats.
 - `DATE_TIME_FORMAT`: The date time format the we use
     - "Day/Month/Year Hour:Minute:Seconds"
+- `TESSERACT_CONFIG`: The arguments tesseract gets when reading the metadata strip.
+- `OCR_CACHE_PATH`: The SQLite file that caches the text read per metadata strip. Can be turned off with the `OCR_CACHE` environment variable.
 """
 
 IMAGE_METADATA_HEIGHT = 120
 
+ALL_LABELS = [
+  "miscellaneous", "duck", "goose", "duckling", "gosling", "hare", "rabbit", 
+  "ice_diver", "egyptian_goose", "egyptian_gosling", "coot", "swan", "crow", 
+  "pidgeon", "magpie", "cat", "oystercatcher", "lapwing", "starling", "redshank", 
+  "skylark", "meadow_pipit", "godwit", "shoveler", "summer_teal", "tufted_duck", 
+  "gadwall", "fox", "buzzard", "goshawk", "harrier", "sparrowhawk", "beech_marten", 
+  "polecat", "weasel", "ermine", "rat", "house_cat", "jackdaw", "raven", 
+  "greylag_goose", "canadian_goose", "wagtail", "blackbird", "moorhen", 
+  "common_shelduck", "black_headed_seagull", "heron", "pheasant", "stork", 
+  "dog", "swallow", "tit", "orinoco_goose", "singing_bushlark", "seagull", 
+  "pheasant_female", "kestrel"
+]
+
 APPROPRIATE_FORMATS = ('.png', '.jpg', '.jpeg')
-DATE_TIME_FORMAT = "%d/%m/%Y %H:%M:%S"
\ No newline at end of file
+DATE_TIME_FORMAT = "%d/%m/%Y %H:%M:%S"
+TESSERACT_CONFIG = '--psm 11'
+OCR_CACHE_PATH = 'results/.cache/ocr.sqlite'
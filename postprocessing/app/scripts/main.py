@@ -1,15 +1,40 @@
 import os
-from PIL import Image
-from .classes.metadata import MetadataProvider
+import time
 from .config.constants import APPROPRIATE_FORMATS
+from .postprocessing.metadata_extraction import extract_metadata_parallel
 from .postprocessing.postprocess import remove_duplicates
 from .postprocessing.stat_generator import get_statistics
+from .utils.annotation_index import build_detection_index, get_inference_data
+from .utils.detection_store import read_detections
+from .utils.metadata_table import write_metadata_table, read_metadata_table
+from .utils.stage_metrics import StageMetrics
 import json
 import traceback
 
 IMAGE_PATH = 'images'
 RESULTS_PATH = 'results'
-ANNOTATION_FILE = 'annotations.json'
+# The results of the stages that are shared by all models
+SHARED_RESULTS_PATH = os.path.join(RESULTS_PATH, 'metadata')
+# The metadata of every image, extracted once per run and shared by all models
+METADATA_TABLE_PATH = os.path.join(SHARED_RESULTS_PATH, 'metadata.arrow')
+DETECTION_STORE_FILE = 'detections.arrow'
+# The time per image of every stage, next to the results of a model (and of the metadata stage)
+METRICS_FILE = 'postprocessing_metrics.json'
+METADATA_METRICS_PATH = os.path.join(SHARED_RESULTS_PATH, 'metrics.json')
+# Only these columns of the detection store are read
+DETECTION_COLUMNS = ['path', 'image_id', 'category_id', 'category', 'score', 'bbox_x', 'bbox_y', 'bbox_width', 'bbox_height']
+# Amount of processes that run OCR. Defaults to the amount of CPU cores
+ocr_workers = int(os.environ.get('OCR_WORKERS', 0)) or None
+
+def find_images(target_folder):
+    '''
+    Find the images in the target folder that are postprocessed
+    '''
+    image_paths = find_image_filepaths(target_folder)
+    return [image_path for image_path in image_paths if os.path.isfile(image_path) and image_path.lower().endswith(APPROPRIATE_FORMATS)]
+
+def get_relative_path(image_path, target_folder):
+    return os.path.normpath(image_path).replace(os.sep, '/').replace(target_folder + "/", "")
 
 def find_image_filepaths(folder_path, extensions=('jpg', 'jpeg', 'png', 'bmp', 'tiff', 'gif')):
     """
@@ -36,100 +61,57 @@ def find_image_filepaths(folder_path, extensions=('jpg', 'jpeg', 'png', 'bmp', '
     
     return image_filepaths
 
-def get_inference_data(filename, complete_annotation_json):
+def generate_results(target_folder, results_folder, model, image_metadata=None, metrics=None):
     '''
-    Get all scores, bboxes and labels, for a given file
-
-    Parameters
-    ----------
-        filename: String
-            The file that we want information from
-        complete_annotation_json: JSON
-            The complete annotation JSON
-
-    Returns
-    -------
-        scores: list
-            A list of all scores for the given file.
-        boxes: list
-            A list of all bboxes for the given file.
-        labels: list
-            A list of all labels for the given file.
-    '''
-    scores, boxes, labels = [], [], []
-    images = complete_annotation_json['images']
-    image_id = None
-    for item in images:
-        if item['file_name'] == filename:
-            image_id = item['id']
-            break
-    if image_id == None:
-        raise IndexError(f"An image id should have been found for '{filename}', but got None")
-
-    annotations = complete_annotation_json['annotations']
-    all_annotations = [annotation for annotation in annotations if annotation['image_id'] == image_id]
-
-    for annotation in all_annotations:
-        scores.append(annotation['score'])
-        boxes.append(annotation['bbox'])
-        labels.append(annotation['category_id'])
-    
-    return scores, boxes, labels
-    
-def process(target_folder, results_folder, model):
-    '''
-    Proces the inference data to statistics
+    Combine the inference data with the metadata of every image, one image at a time
 
     Parameters
     ----------
         target_folder: String
             The folder with all used images
         results_folder: JSON
-            The folder with the inference data (the annotations json)
+            The folder with the inference data (the detection store)
         model: String
             The used model
+        image_metadata: dictionary
+            The metadata table of the run (see load_metadata). Only the images that are
+            not in it are extracted here. Defaults to extracting every image
+        metrics: StageMetrics
+            Records the `ocr` stage of the extracted images, and the `join` stage of every image. Optional
 
     Returns
     -------
-        results: JSON
-            JSON data with all results (not filtered on duplicates)
-        
-        OR
-            
-        removed_duplicates: JSON
-            JSON data with the results (filtered on duplicates)
-        
+        results: generator
+            Yields the result (JSON data) of every image
     '''
     # Initialize state
-    mdp = MetadataProvider(mode="inference")
-    
-    results = []
     cat_dict = {}
-    image_paths = find_image_filepaths(target_folder)
     
-    complete_annotation_json = None
-    with open(os.path.join(results_folder, model, ANNOTATION_FILE), 'r') as file:
-        complete_annotation_json = json.load(file)
-    categories = complete_annotation_json["categories"]
+    # The store is memory mapped, and only the needed columns are read
+    detections = read_detections(os.path.join(results_folder, model, DETECTION_STORE_FILE), columns=DETECTION_COLUMNS)
+
+    # Index the detections once, so every image lookup below is a dictionary access
+    annotation_index = build_detection_index(detections)
 
     # Dictionary with all id's and the labels
-    for category in categories:
-        cat_dict[category["id"]] = category["name"]
+    for category_id, category in zip(detections['category_id'].to_pylist(), detections['category'].to_pylist()):
+        if category_id is not None:
+            cat_dict[category_id] = category
     
-    # Loop over every file in the target folder
-    for image_path in image_paths:        
-        # Check if the file is an image
-        if (not (os.path.isfile(image_path) and image_path.lower().endswith(APPROPRIATE_FORMATS))):
-            continue
+    image_paths = find_images(target_folder)
+    relative_paths = [get_relative_path(image_path, target_folder) for image_path in image_paths]
 
-        # Load the image
-        image = Image.open(image_path)
-        
-        # Perform preprocessing
-        image_main, image_metadata = mdp.split_image_and_metadata(image)
-        metadata = mdp.extract_metadata(image_metadata)
+    # OCR is the slowest step, so the images that are not in the metadata table are extracted in parallel
+    image_metadata = dict(image_metadata or {})
+    missing = [(image_path, relative_path) for image_path, relative_path in zip(image_paths, relative_paths) if relative_path not in image_metadata]
+    if len(missing) > 0:
+        missing_metadata = extract_metadata_parallel([image_path for image_path, _ in missing], num_workers=ocr_workers, metrics=metrics)
+        image_metadata.update(zip([relative_path for _, relative_path in missing], missing_metadata))
 
-        relative_path = os.path.normpath(image_path).replace(os.sep, '/').replace(target_folder + "/", "")
+    # Loop over every file in the target folder
+    for image_path, relative_path in zip(image_paths, relative_paths):
+        join_start = time.perf_counter()
+        metadata = image_metadata[relative_path]
         path_components = relative_path.split("/")
         current_camera = path_components[0] if len(path_components) > 1 else metadata[2]
         current_leging = path_components[1] if len(path_components) > 2 else ""
@@ -137,15 +119,16 @@ def process(target_folder, results_folder, model):
         # Filter results
         filtered_boxes, filtered_labels, filtered_scores = [], [], []
 
-        scores, boxes, labels = get_inference_data(os.path.join(*(image_path.split(os.path.sep)[1:])), complete_annotation_json)
+        scores, boxes, labels = get_inference_data(os.path.join(*(image_path.split(os.path.sep)[1:])), annotation_index)
         
         for i in range(len(scores)):
             filtered_boxes.append(boxes[i])
             filtered_labels.append(cat_dict[labels[i]])
             filtered_scores.append(scores[i])
 
-        # Store results in a list
-        results.append({
+        if metrics is not None:
+            metrics.record('join', time.perf_counter() - join_start)
+        yield {
             'target_filename': image_path,
             'metadata': {
                 'date': metadata[0],
@@ -156,10 +139,46 @@ def process(target_folder, results_folder, model):
             'coco_boxes': filtered_boxes,
             'labels': filtered_labels,
             'scores': filtered_scores
-        })
+        }
+
+def process(target_folder, results_folder, model, image_metadata=None, metrics=None):
+    '''
+    Proces the inference data to statistics
+
+    Parameters
+    ----------
+        target_folder: String
+            The folder with all used images
+        results_folder: JSON
+            The folder with the inference data (the detection store)
+        model: String
+            The used model
+        image_metadata: dictionary
+            The metadata table of the run (see load_metadata)
+        metrics: StageMetrics
+            Records the stages of generate_results, and the `dedup` stage. Optional
 
-    if os.environ["FILTER_BATCHES"] == 'True':
+    Returns
+    -------
+        results: generator
+            The results (not filtered on duplicates), generated one at a time,
+            so they never all have to be in memory
+        
+        OR
+            
+        removed_duplicates: JSON
+            JSON data with the results (filtered on duplicates)
+        
+    '''
+    results = generate_results(target_folder, results_folder, model, image_metadata, metrics)
+
+    # The duplicates can only be removed when all results are known
+    if os.environ.get("FILTER_BATCHES", "True") == 'True':
+        results = list(results)
+        dedup_start = time.perf_counter()
         removed_duplicates = remove_duplicates(results)
+        if metrics is not None:
+            metrics.record('dedup', time.perf_counter() - dedup_start, len(results))
         return removed_duplicates
     
     return results
@@ -179,21 +198,85 @@ def print_result(coco_boxes, labels, scores, metadata):
     for label, score in zip(labels, scores):
         print(f"Label: {label}, Score: {score:.4f}")
 
+def extract_metadata(target_folder, metrics=None):
+    '''
+    Extract the metadata of every image into the metadata table, without the inference data.
+    The metadata doesn't depend on the detections, so this stage runs while the models infer.
+
+    Parameters
+    ----------
+        target_folder: String
+            The folder with all used images
+        metrics: StageMetrics
+            Records the `ocr` stage of every image. Optional
+
+    Returns
+    -------
+        image_metadata: dictionary
+            The metadata table, see read_metadata_table
+    '''
+    image_paths = find_images(target_folder)
+    relative_paths = [get_relative_path(image_path, target_folder) for image_path in image_paths]
+    all_metadata = extract_metadata_parallel(image_paths, num_workers=ocr_workers, metrics=metrics)
+
+    write_metadata_table(METADATA_TABLE_PATH, relative_paths, all_metadata)
+    print(f"Extracted the metadata of {len(image_paths)} images")
+    return dict(zip(relative_paths, all_metadata))
+
+def load_metadata(target_folder):
+    '''
+    Get the metadata table of the run. When the metadata stage didn't run, the metadata is extracted
+    now, once for all models.
+
+    Parameters
+    ----------
+        target_folder: String
+            The folder with all used images
+
+    Returns
+    -------
+        image_metadata: dictionary
+            The metadata table, see read_metadata_table
+    '''
+    if os.path.exists(METADATA_TABLE_PATH):
+        return read_metadata_table(METADATA_TABLE_PATH)
+
+    return extract_metadata(target_folder)
+
+def get_run_totals(num_images, start):
+    seconds = time.perf_counter() - start
+    return {'images': num_images, 'seconds': round(seconds, 3), 'images_per_second': round(num_images / seconds, 2) if seconds > 0 else 0.0}
+
 if (__name__ == '__main__'):
+    # 'metadata' only extracts the metadata, 'process' (the default) postprocesses the models
+    stage = os.environ.get("STAGE", "process")
+    model = None
     try:
-        model_lst = os.environ["MODELS"].split(',')
-        model = None
-        for model in model_lst:
-            print(f"Current model: {model}")
-            results = process(IMAGE_PATH, RESULTS_PATH, model)
-
-            stats = get_statistics(results)
-            with open(os.path.join("results", model, 'stats.json'), "w") as file:
-                json.dump(stats, file, indent=4)
+        os.makedirs(SHARED_RESULTS_PATH, exist_ok=True)
+        if stage == 'metadata':
+            metrics = StageMetrics()
+            start = time.perf_counter()
+            image_metadata = extract_metadata(IMAGE_PATH, metrics)
+            metrics.write(METADATA_METRICS_PATH, get_run_totals(len(image_metadata), start))
+        else:
+            # The metadata doesn't depend on the model, so every model joins against the same table
+            image_metadata = load_metadata(IMAGE_PATH)
+
+            model_lst = os.environ["MODELS"].split(',')
+            for model in model_lst:
+                print(f"Current model: {model}")
+                metrics = StageMetrics()
+                start = time.perf_counter()
+                results = process(IMAGE_PATH, RESULTS_PATH, model, image_metadata, metrics)
+
+                stats = get_statistics(results)
+                with open(os.path.join("results", model, 'stats.json'), "w") as file:
+                    json.dump(stats, file, indent=4)
+                metrics.write(os.path.join(RESULTS_PATH, model, METRICS_FILE), get_run_totals(len(image_metadata), start))
     except Exception as exception:
         traceback.print_exc()
         error_message = f'[POSTPROCESSING]: {str(exception)}'
-        error_log_path = os.path.join("results", model, "error.log")
+        error_log_path = os.path.join("results", model, "error.log") if model is not None else os.path.join(SHARED_RESULTS_PATH, "error.log")
         with open(error_log_path, 'w') as file:
             file.write(error_message)
         exit(1)
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""
+This module extracts the metadata (date, time and camera) of many images in parallel.
+
+OCR with tesseract is the slowest part of the postprocessing. Every image is independent, so the
+images are spread over a pool of processes. The results are returned in the same order as the images.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from ..classes.metadata import MetadataProvider
+from ..config.constants import OCR_CACHE_PATH
+
+# Amount of images that are sent to a worker process at once, to limit the communication overhead
+CHUNK_SIZE = 8
+
+use_ocr_cache = os.environ.get('OCR_CACHE', 'True') == 'True'
+
+metadata_provider = None
+metadata_provider_pid = None
+
+def get_metadata_provider():
+    # Every (worker) process creates its own provider once.
+    # A forked process must not reuse the provider (and cache connection) of its parent.
+    global metadata_provider, metadata_provider_pid
+    if metadata_provider is None or metadata_provider_pid != os.getpid():
+        metadata_provider = MetadataProvider(mode="inference", ocr_cache_path=OCR_CACHE_PATH if use_ocr_cache else None)
+        metadata_provider_pid = os.getpid()
+    return metadata_provider
+
+def extract_image_metadata(image_path):
+    '''
+    Load the bottom strip of an image and extract the metadata from it
+
+    Parameters
+    ----------
+        image_path: String
+            The path of the image
+
+    Returns
+    -------
+        metadata: tuple
+            The date, time and camera of the image
+    '''
+    mdp = get_metadata_provider()
+
+    # Only the bottom strip is needed for OCR, the main part of the image is never loaded
+    image_metadata = mdp.load_metadata_strip(image_path)
+    return mdp.extract_metadata(image_metadata)
+
+def timed_extract_image_metadata(image_path):
+    '''
+    Extract the metadata of an image, and measure how long it took.
+    The time is returned, so it also reaches the parent when the image is done in a worker process.
+    '''
+    start = time.perf_counter()
+    metadata = extract_image_metadata(image_path)
+    return metadata, time.perf_counter() - start
+
+def get_cpu_count():
+    '''
+    Get the amount of cores this process may use. In a container pinned to some cores, that is less than the cores of the machine.
+    '''
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def extract_metadata_parallel(image_paths, num_workers=None, metrics=None):
+    '''
+    Extract the metadata of many images, using a pool of processes
+
+    Parameters
+    ----------
+        image_paths: list
+            The paths of the images
+        num_workers: int
+            The amount of processes. Defaults to the amount of CPU cores this process may use.
+            With 1 worker, no processes are started.
+        metrics: StageMetrics
+            Records the `ocr` stage of every image. Optional
+
+    Returns
+    -------
+        all_metadata: list
+            The (date, time, camera) tuple per image, in the same order as image_paths
+    '''
+    num_workers = num_workers or get_cpu_count()
+    if num_workers == 1 or len(image_paths) <= 1:
+        timed_metadata = [timed_extract_image_metadata(image_path) for image_path in image_paths]
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            timed_metadata = list(executor.map(timed_extract_image_metadata, image_paths, chunksize=CHUNK_SIZE))
+
+    if metrics is not None:
+        for _, seconds in timed_metadata:
+            metrics.record('ocr', seconds)
+    return [metadata for metadata, _ in timed_metadata]
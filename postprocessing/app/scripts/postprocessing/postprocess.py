@@ -1,11 +1,14 @@
+import numpy as np
 import pandas as pd
 
-from ..config.constants import DATE_TIME_FORMAT
+from ..config.constants import DATE_TIME_FORMAT, ALL_LABELS
 
 # This is in seconds. We CAN NOT go lower than 60, because there are some images that only contain hour and minutes as metadata (AM/PM images)
 ACCEPTED_TIME_DIFFERENCE = 60
 # Which number the first batch should have
 BATCH_START_NUMBER = 0
+# Amount of label combination pairs that are generated and compared at once. Limits the memory of very long batches
+DOMINANCE_CHUNK_SIZE = 65536
 
 def __generate_batches(to_batch):
     '''
@@ -32,8 +35,8 @@ def __generate_batches(to_batch):
     batched_data = batched_data.sort_values(['camera', 'datetime']).reset_index(drop=True) # Sort the dataframe on camera and date time
     batched_data['time_diff'] = batched_data.groupby('camera')['datetime'].diff().dt.total_seconds() # Calculate the time difference between data rows
     batched_data['batch'] = (
-        batched_data.groupby('camera')['time_diff']
-          .apply(lambda x: (x > ACCEPTED_TIME_DIFFERENCE).cumsum() + BATCH_START_NUMBER)
+        (batched_data['time_diff'] > ACCEPTED_TIME_DIFFERENCE)
+          .groupby(batched_data['camera']).cumsum() + BATCH_START_NUMBER
     ) # Get the batch number
     batched_data['batch'] = batched_data['camera'] + '_' + batched_data['batch'].astype(str)
     batched_data = batched_data.drop(columns=['time_diff', 'datetime'])
@@ -55,71 +58,92 @@ def __generate_labels_as_string(dataframe):
     dataframe['label_str'] = dataframe['labels'].apply(__process_labels)
     return dataframe
 
-def __get_items_to_keep(batch_list):
+def __count_labels(label_lists):
     '''
-    Generate a list with a list of labels, that we want to keep
-    This is done by checking if a list of labels is not a subset of 
-    another list of labels. This way, we only have the unique label combinations.
+    Generate a compact multiset representation of the labels of every image:
+    a count vector with the amount of times each label occurs
 
     Parameters
     ----------
-    batch_list: list
-        A list with all labels from a specific batch
+    label_lists: list
+        A list with the list of labels of every image
     
     Returns
     -------
-    unique_labels: list
-        A list with a list of labels that we want to keep
+    label_counts: numpy array
+        An array with a row per image and a column per label (ALL_LABELS, followed by any unknown labels)
     '''
-    # Sort by length in descending order
-    indexed_lst = sorted(
-        ((index, lst) for index, lst in enumerate(batch_list)),
-        key=lambda x: len(x[1]), reverse=True
-    )
-    
-    reduced_lists = []
-    for index, lst in indexed_lst:
-        if not any(set(lst).issubset(set(other)) for _, other in reduced_lists):
-            reduced_lists.append((index, lst))
-    
-    # Process the labels and return the final result
-    unique_labels = [__process_labels(lst) for _, lst in reduced_lists]
-    return unique_labels
+    label_indices = {label: index for index, label in enumerate(ALL_LABELS)}
+    rows, columns = [], []
+    for row, label_list in enumerate(label_lists):
+        for label in label_list:
+            if label not in label_indices:
+                label_indices[label] = len(label_indices)
+            rows.append(row)
+            columns.append(label_indices[label])
+
+    label_counts = np.zeros((len(label_lists), len(label_indices)), dtype=np.uint16)
+    np.add.at(label_counts, (rows, columns), 1)
+    return label_counts
 
-def __get_file_names(dataframe, final_list):
+def __find_dominated(batches, label_counts):
     '''
-    Gets the file names that we want to keep, based on the given final_list
+    Find the label combinations that are dominated by another combination of the same batch:
+    every label occurs at most as often as in the other one.
+
+    All batches are handled at once: every combination is paired with the other combinations
+    of its batch. The pairs are generated and compared in chunks of about DOMINANCE_CHUNK_SIZE pairs,
+    so the pairs of a long batch are never all in memory at once.
 
     Parameters
     ----------
-    dataframe: DataFrame
-        A dataframe with all needed data for the selection
-    final_list:
-        A list of tuples, with the batch number and labels of the
-        images that we want to keep
+    batches: array
+        The batch of every combination
+    label_counts: numpy array
+        The count vector of every combination, as returned by __count_labels.
+        The combinations of a batch must be distinct.
     
     Returns
     -------
-    filtered_final_list: list
-        A list with the name of images that we want to keep
+    dominated: numpy array
+        A boolean array that is True for every combination that is dominated
     '''
-    filtered_final_list = []
-
-    for batch, label_list in final_list:
-        for label in label_list:
-            matching_rows = dataframe[(dataframe['batch'] == batch) & (dataframe['label_str'] == label)]
-            if not matching_rows.empty:
-                # Get the row with the highest score for that origin-label combo
-                max_score_row = matching_rows.loc[matching_rows['avg_score'].idxmax()]
-
-                # Append the filename of that row to the result
-                filtered_final_list.append(max_score_row['target_filename'])
-
-    return filtered_final_list
+    # Sort the combinations on batch, so the combinations of a batch are next to each other
+    batch_codes = pd.factorize(batches)[0]
+    order = np.argsort(batch_codes, kind='stable')
+    batch_sizes = np.bincount(batch_codes)
+    batch_starts = np.cumsum(batch_sizes) - batch_sizes
+    # Every combination is paired with every combination of its batch (itself included, which is skipped below)
+    num_pairs = batch_sizes[batch_codes[order]]
+    first_other = batch_starts[batch_codes[order]]
+    pair_ends = np.cumsum(num_pairs)
+
+    dominated = np.zeros(len(label_counts), dtype=bool)
+    start = 0
+    while start < len(order):
+        # The combinations whose pairs fit in the chunk, at least one
+        pairs_before = pair_ends[start - 1] if start > 0 else 0
+        end = max(int(np.searchsorted(pair_ends, pairs_before + DOMINANCE_CHUNK_SIZE, side='right')), start + 1)
+
+        chunk_num_pairs = num_pairs[start:end]
+        chunk_items = np.repeat(np.arange(start, end), chunk_num_pairs)
+        pair_offsets = np.arange(len(chunk_items)) - np.repeat(np.cumsum(chunk_num_pairs) - chunk_num_pairs, chunk_num_pairs)
+        chunk_others = first_other[chunk_items] + pair_offsets
+        is_pair = chunk_items != chunk_others
+        chunk_items, chunk_others = order[chunk_items[is_pair]], order[chunk_others[is_pair]]
+
+        # The combinations are distinct, so a dominating combination always has more labels
+        is_dominated = (label_counts[chunk_items] <= label_counts[chunk_others]).all(axis=1)
+        dominated[chunk_items[is_dominated]] = True
+        start = end
+    return dominated
 
 def __make_selection(dataframe):
     '''
-    Makes a selection of images that we will keep
+    Makes a selection of images that we will keep.
+    For every (batch, label combination) pair, the image with the highest average score is selected.
+    Then, only the pairs whose label combination isn't dominated by another combination of the batch are kept.
+    Both steps are done over the whole dataframe at once, instead of per batch.
 
     Parameters
     ----------
@@ -128,18 +152,17 @@ def __make_selection(dataframe):
     
     Returns
     -------
-    filtered_final_result: DataFrame
-        A dataframe with the final selection of images that we want to keep
+    filtered_final_result: set
+        A set with the names of the images that we want to keep
     '''
-    all_batch_names = list(set(dataframe['batch']))
-
-    final_result = []
-    for batch in all_batch_names:
-        batch_data = dataframe[dataframe['batch'] == batch]
-        to_keep = __get_items_to_keep(batch_data['labels'])
-        final_result.append((batch, to_keep))
-   
-    filtered_final_result = __get_file_names(dataframe, final_result)
+    # The row with the highest score for every (batch, label string) pair
+    best_rows = dataframe.groupby(['batch', 'label_str'], sort=False)['avg_score'].idxmax()
+
+    # Images with the same label string have the same labels, so one count vector per pair is enough
+    label_counts = __count_labels(dataframe.loc[best_rows.values, 'labels'])
+    dominated = __find_dominated(best_rows.index.get_level_values('batch'), label_counts)
+
+    filtered_final_result = set(dataframe.loc[best_rows.values[~dominated], 'target_filename'])
     return filtered_final_result
     
 
@@ -157,6 +180,9 @@ def remove_duplicates(to_filter):
     return_filtered_results: list
         A list containing all data of images that we DO want to use
     '''
+    if len(to_filter) == 0:
+        return []
+
     batch_result = __generate_batches(to_filter)
 
     modified_dataframe = __generate_average_score(batch_result)
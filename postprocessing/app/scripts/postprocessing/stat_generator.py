@@ -94,23 +94,68 @@ def get_species_by_hour(results):
 
     return species_by_hour
 
+class StatisticsAggregator:
+    '''
+    Aggregates every statistic of stats.json while the results stream by, in a single pass.
+    Results are added one at a time, so they never have to be in memory all at once.
+    '''
+    def __init__(self):
+        self.observations_by_specie = {}
+        self.observations_by_camera = {}
+        self.observations_by_leging = {}
+        self.species_by_hour = {}
+
+    def add(self, result):
+        '''
+        Add the labels of a single result to the statistics
+
+        Parameters:
+            result: dictionary
+                A single result, like process() generates them
+        '''
+        animals = result['labels']
+        camera_id = result['metadata']['camera']
+        leging_id = f"{camera_id}_{result['metadata']['leging']}"
+        hour = result['metadata']['time'].split(':')[0]
+        hour = hour[1] if hour[0] == '0' else hour # We do not want an extra zero in front of the single digits
+
+        self.observations_by_camera[camera_id] = self.observations_by_camera.get(camera_id, 0) + len(animals)
+        self.observations_by_leging[leging_id] = self.observations_by_leging.get(leging_id, 0) + len(animals)
+
+        for animal in animals:
+            self.observations_by_specie[animal] = self.observations_by_specie.get(animal, 0) + 1
+
+            animal_by_hour = self.species_by_hour.setdefault(animal, {})
+            animal_by_hour[hour] = animal_by_hour.get(hour, 0) + 1
+
+    def get_statistics(self):
+        '''
+        Returns:
+            statistics: JSON
+                JSON data, which contains the processed results
+        '''
+        return {
+            'observations_by_specie': self.observations_by_specie,
+            'observations_by_camera': self.observations_by_camera,
+            'observations_by_leging': self.observations_by_leging,
+            'species_by_hour': self.species_by_hour
+        }
+
 def get_statistics(results):
     '''
-    Get the statistics, generated from the given results
+    Get the statistics, generated from the given results.
+    The results are only iterated once, so they can also be a generator.
 
     Parameters:
-        results: JSON
-            JSON data of the final results
+        results: iterable
+            The final results
 
     Returns:
         statistics: JSON
             JSON data, which contains the processed results
     '''
-    statistics = {
-        'observations_by_specie': get_animal_count(results),
-        'observations_by_camera': get_animal_observation_total(results, mode='camera'),
-        'observations_by_leging': get_animal_observation_total(results),
-        'species_by_hour': get_species_by_hour(results)
-    }
+    aggregator = StatisticsAggregator()
+    for result in results:
+        aggregator.add(result)
     
-    return statistics
\ No newline at end of file
+    return aggregator.get_statistics()
@@ -0,0 +1,114 @@
+"""
+This module provides a one-pass index over a COCO annotation file or a detection store.
+
+Looking up the annotations of an image by scanning the `images` and `annotations` lists costs
+O(images x annotations) for a whole run. The index is built once when the file is loaded, after
+which every lookup is a dictionary access.
+
+Functionality:
+- `build_annotation_index`:
+    Builds the file_name -> image_id and image_id -> annotations dictionaries.
+
+- `build_detection_index`:
+    Builds the same dictionaries from the detections of a detection store.
+
+- `get_inference_data`:
+    Gets all scores, bboxes and labels for a given file, using the index.
+"""
+
+def build_annotation_index(complete_annotation_json):
+    '''
+    Index the images and annotations of a COCO annotation JSON
+
+    Parameters
+    ----------
+        complete_annotation_json: JSON
+            The complete annotation JSON
+
+    Returns
+    -------
+        annotation_index: tuple
+            image_ids: dictionary
+                The dictionary key is the file name
+                The dictionary value is the image id
+            annotations_by_image: dictionary
+                The dictionary key is the image id
+                The dictionary value is a list with all annotations of that image
+    '''
+    image_ids = {}
+    for item in complete_annotation_json['images']:
+        # Keep the first image with a file name, like a linear search would find
+        image_ids.setdefault(item['file_name'], item['id'])
+
+    annotations_by_image = {}
+    for annotation in complete_annotation_json['annotations']:
+        annotations_by_image.setdefault(annotation['image_id'], []).append(annotation)
+
+    return image_ids, annotations_by_image
+
+def build_detection_index(detections):
+    '''
+    Index the detections of a detection store, like build_annotation_index does for a COCO annotation JSON
+
+    Parameters
+    ----------
+        detections: pyarrow Table
+            The detections, with at least the path, image_id, category_id, score and bbox columns
+
+    Returns
+    -------
+        annotation_index: tuple
+            image_ids: dictionary
+                The dictionary key is the path of the image
+                The dictionary value is the image id
+            annotations_by_image: dictionary
+                The dictionary key is the image id
+                The dictionary value is a list with all annotations of that image
+    '''
+    columns = detections.select(['path', 'image_id', 'category_id', 'score', 'bbox_x', 'bbox_y', 'bbox_width', 'bbox_height']).to_pydict()
+
+    image_ids = {}
+    annotations_by_image = {}
+    for path, image_id, category_id, score, x, y, width, height in zip(*columns.values()):
+        image_ids.setdefault(path, image_id)
+
+        # Images without detections only have a row without category
+        if category_id is None:
+            continue
+        annotations_by_image.setdefault(image_id, []).append({'score': score, 'bbox': [x, y, width, height], 'category_id': category_id})
+
+    return image_ids, annotations_by_image
+
+def get_inference_data(filename, annotation_index):
+    '''
+    Get all scores, bboxes and labels, for a given file
+
+    Parameters
+    ----------
+        filename: String
+            The file that we want information from
+        annotation_index: tuple
+            The index, as returned by build_annotation_index
+
+    Returns
+    -------
+        scores: list
+            A list of all scores for the given file.
+        boxes: list
+            A list of all bboxes for the given file.
+        labels: list
+            A list of all labels for the given file.
+    '''
+    image_ids, annotations_by_image = annotation_index
+
+    image_id = image_ids.get(filename)
+    if image_id == None:
+        raise IndexError(f"An image id should have been found for '{filename}', but got None")
+
+    scores, boxes, labels = [], [], []
+    for annotation in annotations_by_image.get(image_id, []):
+        scores.append(annotation['score'])
+        boxes.append(annotation['bbox'])
+        labels.append(annotation['category_id'])
+    
+    return scores, boxes, labels
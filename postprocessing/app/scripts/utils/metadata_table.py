@@ -0,0 +1,71 @@
+"""
+This module provides the metadata table of a run, as an Arrow IPC file.
+
+The date, time and camera of an image are read from its metadata strip, and don't depend on the model.
+The metadata is extracted once per image per run and written to the table, and the postprocessing of
+every model joins its detections against the table, instead of running OCR on every image again.
+
+Columns:
+- `path`: The path of the image, relative to the images folder.
+- `date`, `time`, `camera`: The metadata that was read from the image.
+
+Functionality:
+- `write_metadata_table`:
+    Writes the metadata of all images to a table.
+
+- `read_metadata_table`:
+    Reads a table into a dictionary, so every image lookup is a dictionary access.
+"""
+
+import os
+import pyarrow as pa
+
+METADATA_TABLE_SCHEMA = pa.schema([
+    ('path', pa.string()),
+    ('date', pa.string()),
+    ('time', pa.string()),
+    ('camera', pa.string())
+])
+
+def write_metadata_table(filepath, relative_paths, all_metadata):
+    '''
+    Write the metadata of all images to a table. The table only gets its real name when it is
+    complete, so an interrupted extraction never leaves a half written table behind.
+
+    Parameters
+    ----------
+        filepath: String
+            The path of the Arrow IPC file
+        relative_paths: list
+            The paths of the images, relative to the images folder
+        all_metadata: list
+            The (date, time, camera) tuple per image, in the same order as relative_paths
+    '''
+    dates, times, cameras = zip(*all_metadata) if len(all_metadata) > 0 else ([], [], [])
+    table = pa.table([list(relative_paths), list(dates), list(times), list(cameras)], schema=METADATA_TABLE_SCHEMA)
+
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+    temporary_filepath = filepath + '.tmp'
+    with pa.ipc.new_file(temporary_filepath, METADATA_TABLE_SCHEMA) as writer:
+        writer.write_table(table)
+    os.replace(temporary_filepath, filepath)
+
+def read_metadata_table(filepath):
+    '''
+    Read a table
+
+    Parameters
+    ----------
+        filepath: String
+            The path of the Arrow IPC file
+
+    Returns
+    -------
+        image_metadata: dictionary
+            The dictionary key is the path of the image, relative to the images folder
+            The dictionary value is the (date, time, camera) tuple of the image
+    '''
+    with pa.memory_map(filepath, 'r') as source:
+        columns = pa.ipc.open_file(source).read_all().to_pydict()
+
+    return {path: (date, time, camera) for path, date, time, camera in zip(columns['path'], columns['date'], columns['time'], columns['camera'])}
@@ -0,0 +1,82 @@
+"""
+This module provides a persistent cache for the text that tesseract reads from the metadata strips.
+
+Frames of the same burst often have identical bottom strips, and the same folders are postprocessed
+over and over. The cache is keyed by a hash of the cropped strip (its pixels, shape and type) together
+with the tesseract configuration, so a strip that was already read never goes to tesseract again.
+
+The cache is a SQLite file, so it can be shared by the OCR worker processes.
+"""
+
+import os
+import sqlite3
+import hashlib
+import numpy as np
+
+# Seconds a process waits when another process is writing to the cache
+SQLITE_TIMEOUT = 30
+
+class OcrCache:
+    def __init__(self, filepath, tesseract_config):
+        """
+        Opens (or creates) the cache
+
+        Parameters
+        ----------
+        filepath : str
+            The path to the SQLite file
+
+        tesseract_config : str
+            Everything that changes the output of tesseract, like the arguments and version.
+            Part of every key, so changing it doesn't return outdated text.
+        """
+        self.tesseract_config = tesseract_config
+
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(filepath, timeout=SQLITE_TIMEOUT)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS ocr_text (strip_hash TEXT PRIMARY KEY, text TEXT NOT NULL)')
+        self.connection.commit()
+
+    def strip_hash(self, image_strip: np.ndarray):
+        """
+        Returns
+        -------
+        strip_hash : str
+            The key of the strip in the cache
+        """
+        strip_hash = hashlib.sha256()
+        strip_hash.update(self.tesseract_config.encode())
+        strip_hash.update(f'{image_strip.shape}|{image_strip.dtype}'.encode())
+        strip_hash.update(np.ascontiguousarray(image_strip).tobytes())
+        return strip_hash.hexdigest()
+
+    def get_or_read(self, image_strip: np.ndarray, read_text):
+        """
+        Get the text of a strip from the cache, or read it (and store it) when it isn't cached yet
+
+        Parameters
+        ----------
+        image_strip : np.ndarray
+            The cropped metadata strip
+
+        read_text : callable
+            Reads the text of the strip with tesseract, called only on a cache miss
+
+        Returns
+        -------
+        text : str
+            The text of the strip
+        """
+        strip_hash = self.strip_hash(image_strip)
+        row = self.connection.execute('SELECT text FROM ocr_text WHERE strip_hash = ?', (strip_hash,)).fetchone()
+        if row is not None:
+            return row[0]
+
+        text = read_text(image_strip)
+        self.connection.execute('INSERT OR REPLACE INTO ocr_text (strip_hash, text) VALUES (?, ?)', (strip_hash, text))
+        self.connection.commit()
+        return text
+
+    def close(self):
+        self.connection.close()